@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""Benchmarks and resource checks for the log_to_notes.py ingestion pipeline."""
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import log_to_notes  # noqa: E402
+
+MB = 1 << 20
+# The prompt regex used before PromptDetector, kept for comparison.
+LEGACY_COMMAND_RE = re.compile(r"^(?P<prompt>[^\n\r]*[$#])\s*(?P<cmd>.+)$")
+
+
+def legacy_upsert_service(state: Dict, host: str, port: int, protocol: str, service: str, state_name: str, note: str) -> None:
+    """The list-scanning upsert used before upsert_services, kept for comparison."""
+    log_to_notes.register_host(state, host)
+    services = state["hosts"][host].setdefault("services", [])
+    for svc in services:
+        if svc["port"] == port and svc["protocol"] == protocol:
+            svc.update({"service": service, "state": state_name, "note": note, "updated": log_to_notes.utc_now()})
+            return
+    services.append({
+        "port": port,
+        "protocol": protocol,
+        "service": service,
+        "state": state_name,
+        "note": note,
+        "updated": log_to_notes.utc_now(),
+    })
+
+
+def empty_state() -> Dict:
+    return {"engagement": dict(log_to_notes.DEFAULT_ENGAGEMENT), "sources": {}, "timeline": [], "hosts": {}}
+
+
+def write_synthetic_log(path: Path, total_bytes: int, block_bytes: int) -> int:
+    """Write feroxbuster-style blocks of ``block_bytes`` each; return the number of blocks."""
+    blocks = 0
+    written = 0
+    with path.open("w") as handle:
+        while written < total_bytes:
+            prompt = f"kali@kali:~$ feroxbuster -u http://10.10.11.{blocks % 250}/\n"
+            handle.write(prompt)
+            written += len(prompt)
+            size = 0
+            line_no = 0
+            while size < block_bytes:
+                line = f"200      GET       12l       34w      567c http://10.10.11.5/dir/{line_no:08d}\n"
+                handle.write(line)
+                size += len(line)
+                line_no += 1
+            written += size
+            blocks += 1
+        handle.write("kali@kali:~$ \n")
+    return blocks
+
+
+def bench_memory(args: argparse.Namespace) -> int:
+    """Check that peak memory tracks the largest block, not the size of the backlog."""
+    block_bytes = args.block_mb * MB
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = Path(tmp) / "ctf.log"
+        blocks = write_synthetic_log(log_path, args.size_mb * MB, block_bytes)
+        state = empty_state()
+        options = log_to_notes.IngestOptions(
+            max_output=args.max_block_bytes,
+            max_cycle_bytes=args.size_mb * MB * 2,
+            archive=log_to_notes.Archive(Path(tmp) / "archive"),
+        )
+        tracemalloc.start()
+        started = time.perf_counter()
+        log_to_notes.process_once(state, [log_path], options)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    # A block is held as its lines plus one joined copy, next to the chunk being
+    # decoded and split; the line objects roughly double the raw size again.
+    retained = min(block_bytes, args.max_block_bytes)
+    bound = 6 * retained + 8 * log_to_notes.READ_CHUNK_SIZE
+    print(
+        f"memory: {args.size_mb} MB log, {blocks} blocks of {args.block_mb} MB in {elapsed:.2f}s; "
+        f"peak {peak / MB:.1f} MB (bound {bound / MB:.1f} MB)"
+    )
+    recorded = sum(entry["runs"] for entry in state["timeline"])
+    if recorded != blocks:
+        print(f"memory: expected {blocks} recorded runs, got {recorded}")
+        return 1
+    return 0 if peak <= bound else 1
+
+
+def colored_sample(target_bytes: int, color_every: int = 1) -> tuple[str, str]:
+    """Return the same script(1)-style text with and without terminal escapes.
+
+    Every ``color_every``-th output line is coloured; prompts always are.
+    """
+    plain, colored = [], []
+    size = 0
+    line_no = 0
+    while size < target_bytes:
+        if line_no % 200 == 0:
+            text = "\u2514\u2500$ ls --color -la /var/www"
+            escaped = "\x1b]0;kali@kali: ~\x07\x1b[?2004h\x1b[1;32m\u2514\u2500\x1b[1;34m$\x1b[0m ls --color -la /var/www\x1b[?2004l"
+        else:
+            name = f"file_{line_no:06d}.php"
+            text = f"-rw-r--r-- 1 www-data www-data  4096 Nov 19 23:30 {name}"
+            escaped = text
+            if line_no % color_every == 0:
+                escaped = f"-rw-r--r-- 1 www-data www-data  4096 Nov 19 23:30 \x1b[01;32m{name}\x1b[0m\x1b[K"
+        plain.append(text)
+        colored.append(escaped)
+        size += len(escaped) + 1
+        line_no += 1
+    return "\n".join(plain) + "\n", "\n".join(colored) + "\n"
+
+
+def feed_repeatedly(sample: str, total_bytes: int) -> tuple[float, int]:
+    assembler = log_to_notes.BlockAssembler(max_output=MB)
+    fed = 0
+    started = time.perf_counter()
+    while fed < total_bytes:
+        for _ in assembler.feed(sample):
+            pass
+        fed += len(sample)
+    return time.perf_counter() - started, fed
+
+
+def bench_ansi(args: argparse.Namespace) -> int:
+    """Measure the per-byte cost of escape stripping in the block splitter."""
+    plain, colored = colored_sample(MB, args.color_every)
+    total = args.size_mb * MB
+    plain_time, plain_bytes = feed_repeatedly(plain, total * len(plain) // len(colored))
+    colored_time, colored_bytes = feed_repeatedly(colored, total)
+    overhead = max(0.0, colored_time - plain_time * colored_bytes / plain_bytes) * 1e9 / colored_bytes
+    print(
+        f"ansi: plain {plain_bytes / MB / plain_time:.0f} MB/s, "
+        f"escaped {colored_bytes / MB / colored_time:.0f} MB/s over {colored_bytes / MB:.0f} MB; "
+        f"stripping adds {overhead:.2f} ns/byte (limit {args.max_overhead:.2f})"
+    )
+    return 0 if overhead <= args.max_overhead else 1
+
+
+def pathological_lines(length: int) -> Dict[str, str]:
+    """Long output lines full of prompt characters: hash dumps, base64/JS blobs, comment rulers."""
+    return {
+        "shadow": ("root:$6$" + "aB3.x/9" * length)[:length],
+        "dollars": ("$a" * length)[:length],
+        "hashes": ("# " * length)[:length - 1] + "#",
+        "minified": ("var a=$(x)#b;" * length)[:length],
+    }
+
+
+def time_per_line(match, line: str, budget: float = 0.2) -> float:
+    runs = 0
+    started = time.perf_counter()
+    while True:
+        match(line)
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= budget:
+            return elapsed / runs
+
+
+def bench_prompt(args: argparse.Namespace) -> int:
+    """Show that prompt detection costs the same per line however long the line is."""
+    detector = log_to_notes.PromptDetector({"learned": [["kali@kali:", "$", True], ["└─", "$", False]]})
+    legacy = lambda line: LEGACY_COMMAND_RE.match(log_to_notes.sanitize_line(line))  # noqa: E731
+    lengths = [1 << 10, 1 << 14, 1 << 18, args.max_line_kb << 10]
+    worst = 0.0
+    for kind in pathological_lines(1):
+        costs = []
+        for length in lengths:
+            line = pathological_lines(length)[kind]
+            costs.append((time_per_line(legacy, line), time_per_line(detector.match_raw, line)))
+        # Only the first PROMPT_WINDOW characters are inspected, so the cost
+        # should stay flat from the first length above the window onwards.
+        growth = costs[-1][1] / costs[1][1]
+        worst = max(worst, growth)
+        cells = ", ".join(f"{length >> 10}K {old * 1e6:.1f}/{new * 1e6:.1f}us" for length, (old, new) in zip(lengths, costs))
+        print(f"prompt: {kind:9} legacy/detector per line: {cells} (detector growth x{growth:.1f})")
+    print(f"prompt: worst detector growth from 16K to {args.max_line_kb}K lines x{worst:.1f} (limit x{args.max_growth})")
+    return 0 if worst <= args.max_growth else 1
+
+
+# Raw lines as script(1) records them and the text sanitize_line must leave.
+REDRAW_CASES = [
+    ("50%\r\x1b[K100%", "100%"),
+    ("abcdef\r\x1b[2Kxy", "xy"),
+    ("abc\x08\x08X", "aXc"),
+    # bash 5.1+ bracketed paste around a prompt after a command without output
+    ("\x1b[?2004l\r\x1b[?2004hkali@kali:~$ nmap 10.10.11.5", "kali@kali:~$ nmap 10.10.11.5"),
+]
+
+
+def bench_redraw(args: argparse.Namespace) -> int:
+    """Check that in-line redraws resolve to the visible text and keep prompts intact."""
+    failed = 0
+    for raw, expected in REDRAW_CASES:
+        line = log_to_notes.sanitize_line(raw)
+        if line != expected:
+            print(f"redraw: {raw!r} gave {line!r}, expected {expected!r}")
+            failed += 1
+    log = "\x1b[?2004hkali@kali:~$ cd /tmp\r\n\x1b[?2004l\r\x1b[?2004hkali@kali:~$ nmap 10.10.11.5\r\n" \
+        "\x1b[?2004l\rNmap scan report for 10.10.11.5\r\n\x1b[?2004hkali@kali:~$ "
+    commands = [block["command"] for block in log_to_notes.BlockAssembler().feed(log)]
+    if commands != ["cd /tmp", "nmap 10.10.11.5"]:
+        print(f"redraw: bracketed-paste session split into {commands}")
+        failed += 1
+    print(f"redraw: {len(REDRAW_CASES) + 1 - failed} of {len(REDRAW_CASES) + 1} cases passed")
+    return 1 if failed else 0
+
+
+def write_nmap_xml(path: Path, total_bytes: int, ports_per_host: int) -> int:
+    """Write an nmap -oX style report of up hosts until it reaches ``total_bytes``; return the host count."""
+    hosts = 0
+    with path.open("w") as handle:
+        handle.write('<?xml version="1.0"?>\n<nmaprun scanner="nmap" args="nmap -p- -oX scan.xml 10.10.0.0/16">\n')
+        while handle.tell() < total_bytes:
+            handle.write(
+                f'<host><status state="up" reason="syn-ack"/><address addr="10.10.{hosts >> 8 & 255}.{hosts & 255}" addrtype="ipv4"/>'
+                f'<hostnames><hostname name="host{hosts}.lab.local" type="PTR"/></hostnames><ports>'
+            )
+            for port in range(1, ports_per_host + 1):
+                handle.write(
+                    f'<port protocol="tcp" portid="{port}"><state state="open" reason="syn-ack"/>'
+                    f'<service name="http" product="Apache httpd" version="2.4.{port}"/>'
+                    f'<script id="http-title" output="Site {port}"/></port>'
+                )
+            handle.write('</ports><os><osmatch name="Linux 5.0 - 5.14" accuracy="95"/></os></host>\n')
+            hosts += 1
+        handle.write("</nmaprun>\n")
+    return hosts
+
+
+def bench_nmap_xml(args: argparse.Namespace) -> int:
+    """Check that streaming an nmap XML report needs no more memory than the inventory it builds."""
+    with tempfile.TemporaryDirectory() as tmp:
+        report = Path(tmp) / "scan.xml"
+        hosts = write_nmap_xml(report, args.size_mb * MB, args.ports)
+        started = time.perf_counter()
+        log_to_notes.parse_nmap_xml(report, "nmap -oX scan.xml", empty_state())
+        elapsed = time.perf_counter() - started
+        # Measured separately: tracing allocations slows the parser down severalfold.
+        state = empty_state()
+        tracemalloc.start()
+        log_to_notes.parse_nmap_xml(report, "nmap -oX scan.xml", state)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    # Everything above what the parsed inventory keeps is parser overhead,
+    # which should stay at about one <host> element plus the parse buffer.
+    overhead = peak - retained
+    print(
+        f"nmap-xml: {args.size_mb} MB report, {hosts} hosts in {elapsed:.2f}s ({args.size_mb / elapsed:.0f} MB/s); "
+        f"inventory {retained / MB:.1f} MB, parser overhead {overhead / MB:.1f} MB (limit {args.max_overhead_mb} MB)"
+    )
+    if len(state["hosts"]) != hosts:
+        print(f"nmap-xml: expected {hosts} hosts, got {len(state['hosts'])}")
+        return 1
+    return 0 if overhead <= args.max_overhead_mb * MB else 1
+
+
+def nmap_sweep(hosts: int, ports_per_host: int) -> tuple[str, str]:
+    """Return the same /16 sweep as an nmap greppable (-oG) report and as normal console output."""
+    greppable, normal = ["# Nmap 7.94 scan initiated as: nmap -sV -oG - 10.10.0.0/16\n"], []
+    for index in range(hosts):
+        address = f"10.10.{index >> 8 & 255}.{index & 255}"
+        name = f"host{index}.lab.local"
+        ports = [(22 + port, "ssh" if port == 0 else "http", f"Apache httpd 2.4.{port}") for port in range(ports_per_host)]
+        greppable.append(f"Host: {address} ({name})\tStatus: Up\n")
+        listed = ", ".join(f"{port}/open/tcp//{service}//{info}/" for port, service, info in ports)
+        greppable.append(f"Host: {address} ({name})\tPorts: {listed}\tIgnored State: closed ({1000 - ports_per_host})\n")
+        normal.append(f"Nmap scan report for {address}\nHost is up (0.0010s latency).\nPORT     STATE SERVICE VERSION\n")
+        normal.extend(f"{port}/tcp open  {service}    {info}\n" for port, service, info in ports)
+        normal.append("\n")
+    greppable.append(f"# Nmap done at Sat Nov 16 12:00:00 2024 -- {hosts} IP addresses ({hosts} hosts up) scanned\n")
+    return "".join(greppable), "".join(normal)
+
+
+def bench_greppable(args: argparse.Namespace) -> int:
+    """Compare the -oG line parser with scraping console output on a synthetic /16 sweep."""
+    greppable, normal = nmap_sweep(args.hosts, args.ports)
+    command = "nmap -sV -oG - 10.10.0.0/16"
+    state = empty_state()
+    started = time.perf_counter()
+    log_to_notes.parse_nmap_greppable(greppable.splitlines(True), command, state)
+    greppable_time = time.perf_counter() - started
+    started = time.perf_counter()
+    log_to_notes.parse_nmap_output(normal.splitlines(True), command, empty_state())
+    normal_time = time.perf_counter() - started
+    print(
+        f"greppable: {args.hosts} hosts x {args.ports} ports ({len(greppable) / MB:.1f} MB) in {greppable_time:.2f}s "
+        f"({args.hosts / greppable_time:,.0f} hosts/s); console output in {normal_time:.2f}s "
+        f"(x{normal_time / greppable_time:.1f} slower)"
+    )
+    services = sum(len(data["services"]) for data in state["hosts"].values())
+    if len(state["hosts"]) != args.hosts or services != args.hosts * args.ports:
+        print(f"greppable: expected {args.hosts} hosts and {args.hosts * args.ports} services, got {len(state['hosts'])} and {services}")
+        return 1
+    return 0 if greppable_time <= normal_time else 1
+
+
+def time_upserts(hosts: int, ports: int, batched: bool) -> float:
+    """Ingest a full-range scan of ``hosts`` hosts twice (a scan, then a rescan); return seconds per port."""
+    state = empty_state()
+    started = time.perf_counter()
+    for _ in range(2):
+        for index in range(hosts):
+            host = f"10.10.0.{index}"
+            found = [(port, "tcp", "unknown", "filtered", "nmap -p- 10.10.0.0/24") for port in range(1, ports + 1)]
+            if batched:
+                log_to_notes.upsert_services(state, host, found)
+            else:
+                for item in found:
+                    legacy_upsert_service(state, host, item[0], item[1], *item[2:])
+    return (time.perf_counter() - started) / (2 * hosts * ports)
+
+
+def bench_upsert(args: argparse.Namespace) -> int:
+    """Check that ingesting services costs the same per port however many ports a host has."""
+    counts = [args.ports >> 4, args.ports >> 2, args.ports]
+    batched = [time_upserts(args.hosts, count, True) for count in counts]
+    legacy = [time_upserts(args.hosts, count, False) for count in counts[:2]]
+    growth = batched[-1] / batched[0]
+    cells = ", ".join(f"{count} {cost * 1e6:.2f}us" for count, cost in zip(counts, batched))
+    print(f"upsert: {args.hosts} hosts, per-port cost by ports per host: {cells} (growth x{growth:.1f})")
+    cells = ", ".join(f"{count} {cost * 1e6:.2f}us" for count, cost in zip(counts, legacy))
+    print(f"upsert: list-scanning upsert per port: {cells}")
+    return 0 if growth <= args.max_growth else 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="bench", required=True)
+
+    memory = commands.add_parser("memory", help=bench_memory.__doc__)
+    memory.add_argument("--size-mb", type=int, default=128, help="Total size of the synthetic log")
+    memory.add_argument("--block-mb", type=int, default=8, help="Output size of each command block")
+    memory.add_argument(
+        "--max-block-bytes",
+        type=int,
+        default=log_to_notes.DEFAULT_MAX_BLOCK_BYTES,
+        help="Per-block output cap passed to the pipeline",
+    )
+    memory.set_defaults(func=bench_memory)
+
+    ansi = commands.add_parser("ansi", help=bench_ansi.__doc__)
+    ansi.add_argument("--size-mb", type=int, default=1024, help="Amount of escaped log text to push through")
+    ansi.add_argument("--color-every", type=int, default=4, help="Colour every Nth output line")
+    ansi.add_argument("--max-overhead", type=float, default=8.0, help="Allowed stripping cost in ns per escaped byte")
+    ansi.set_defaults(func=bench_ansi)
+
+    prompt = commands.add_parser("prompt", help=bench_prompt.__doc__)
+    prompt.add_argument("--max-line-kb", type=int, default=4096, help="Length of the longest pathological line")
+    prompt.add_argument("--max-growth", type=float, default=2.0, help="Allowed per-line cost growth from 16K lines")
+    prompt.set_defaults(func=bench_prompt)
+
+    redraw = commands.add_parser("redraw", help=bench_redraw.__doc__)
+    redraw.set_defaults(func=bench_redraw)
+
+    nmap_xml = commands.add_parser("nmap-xml", help=bench_nmap_xml.__doc__)
+    nmap_xml.add_argument("--size-mb", type=int, default=100, help="Size of the synthetic XML report")
+    nmap_xml.add_argument("--ports", type=int, default=20, help="Open ports listed per host")
+    nmap_xml.add_argument("--max-overhead-mb", type=int, default=8, help="Allowed memory beyond the parsed inventory")
+    nmap_xml.set_defaults(func=bench_nmap_xml)
+
+    greppable = commands.add_parser("greppable", help=bench_greppable.__doc__)
+    greppable.add_argument("--hosts", type=int, default=65536, help="Hosts in the synthetic sweep (65536 is a /16)")
+    greppable.add_argument("--ports", type=int, default=3, help="Open ports listed per host")
+    greppable.set_defaults(func=bench_greppable)
+
+    upsert = commands.add_parser("upsert", help=bench_upsert.__doc__)
+    upsert.add_argument("--hosts", type=int, default=16, help="Hosts scanned, each twice")
+    upsert.add_argument("--ports", type=int, default=16384, help="Ports per host in the largest scan")
+    upsert.add_argument("--max-growth", type=float, default=2.0, help="Allowed per-port cost growth across scan sizes")
+    upsert.set_defaults(func=bench_upsert)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Shell hook that records each command as a JSON line next to the script(1) log.
+#
+# Source it from ~/.bashrc or ~/.zshrc *inside* the `script` session:
+#
+#   export FLAGCADDY_LOG=/home/kali/ctf.log
+#   source /path/to/flagcaddy/scripts/flagcaddy_hook.sh
+#
+# Every command appends one record to $FLAGCADDY_EVENTS (default: the log path
+# with .events.jsonl instead of .log) holding the command line, working
+# directory, start/end epoch times, exit code and the byte range of its output
+# in the log ("output_offset" to "end"). Run log_to_notes.py with --events to
+# slice outputs by those offsets instead of scanning the log for prompts.
+
+FLAGCADDY_LOG=${FLAGCADDY_LOG:-/home/kali/ctf.log}
+FLAGCADDY_EVENTS=${FLAGCADDY_EVENTS:-${FLAGCADDY_LOG%.log}.events.jsonl}
+
+__flagcaddy_json() {
+  local s=$1
+  s=${s//\\/\\\\}
+  s=${s//\"/\\\"}
+  s=${s//$'\n'/\\n}
+  s=${s//$'\r'/\\r}
+  s=${s//$'\t'/\\t}
+  printf '"%s"' "$s"
+}
+
+__flagcaddy_size() {
+  stat -c %s "$FLAGCADDY_LOG" 2>/dev/null || echo 0
+}
+
+__flagcaddy_start() {
+  __flagcaddy_cmd=$1
+  __flagcaddy_started=$EPOCHREALTIME
+  __flagcaddy_offset=$(__flagcaddy_size)
+}
+
+__flagcaddy_finish() {
+  local rc=$1
+  [[ -n "${__flagcaddy_started:-}" ]] || return 0
+  # script(1) copies the pty to the log asynchronously; give it a moment to
+  # catch up with the last output before taking the end offset.
+  sleep "${FLAGCADDY_SETTLE:-0.05}"
+  printf '{"command":%s,"cwd":%s,"start":%s,"end":%s,"exit":%d,"output_offset":%d,"end_offset":%d}\n' \
+    "$(__flagcaddy_json "$__flagcaddy_cmd")" "$(__flagcaddy_json "$PWD")" \
+    "$__flagcaddy_started" "$EPOCHREALTIME" "$rc" "$__flagcaddy_offset" "$(__flagcaddy_size)" \
+    >>"$FLAGCADDY_EVENTS"
+  __flagcaddy_started=
+}
+
+if [[ -n "${ZSH_VERSION:-}" ]]; then
+  zmodload zsh/datetime
+  __flagcaddy_preexec() { __flagcaddy_start "$1"; }
+  __flagcaddy_precmd() { __flagcaddy_finish $?; }
+  preexec_functions+=(__flagcaddy_preexec)
+  # First in line so it still sees the exit status of the command.
+  precmd_functions=(__flagcaddy_precmd $precmd_functions)
+elif [[ -n "${BASH_VERSION:-}" ]]; then
+  __flagcaddy_status=0
+  __flagcaddy_armed=
+  __flagcaddy_histnum=
+  __flagcaddy_preexec() {
+    [[ -n "$__flagcaddy_armed" && -z "${COMP_LINE:-}" ]] || return 0
+    __flagcaddy_armed=
+    # Enter on an empty line runs PROMPT_COMMAND straight away.
+    [[ "$BASH_COMMAND" != '__flagcaddy_status=$?' ]] || return 0
+    local line number
+    line=$(HISTTIMEFORMAT= builtin history 1)
+    read -r number _ <<<"$line"
+    line=${line#*[0-9]  }
+    # A command kept out of history (HISTCONTROL=ignorespace/ignoredups)
+    # leaves the previous one in `history 1`; unless it is a repeat of that,
+    # only its first simple command is known.
+    if [[ "$number" == "$__flagcaddy_histnum" && "$line" != "$BASH_COMMAND"* ]]; then
+      line=
+    fi
+    __flagcaddy_histnum=$number
+    __flagcaddy_start "${line:-$BASH_COMMAND}"
+  }
+  __flagcaddy_precmd() { __flagcaddy_finish "$__flagcaddy_status"; }
+  # The DEBUG trap fires before every simple command, including the ones in
+  # PROMPT_COMMAND, so it is only armed once the prompt has been drawn.
+  trap '__flagcaddy_preexec' DEBUG
+  PROMPT_COMMAND="__flagcaddy_status=\$?; __flagcaddy_precmd${PROMPT_COMMAND:+; $PROMPT_COMMAND}; __flagcaddy_armed=1"
+fi
@@ -0,0 +1,102 @@
+"""FIFO and socket capture streams for log_to_notes.py --fifo/--socket."""
+from __future__ import annotations
+
+import os
+import select
+import socket
+import stat
+import time
+from pathlib import Path
+from typing import Optional
+
+LIVE_READ_SIZE = 1 << 20
+LIVE_SPILL_BYTES = 256 << 10
+
+
+class LiveStream:
+    """Read a capture stream from a FIFO or a Unix socket (one writer at a time) as it is written."""
+
+    def __init__(self, path: Path, kind: str) -> None:
+        self.path = path
+        self.kind = kind
+        self._server: Optional[socket.socket] = None
+        self._client: Optional[socket.socket] = None
+        self._fd: Optional[int] = None
+        if kind == "fifo":
+            if not path.exists():
+                os.mkfifo(path, 0o600)
+            elif not stat.S_ISFIFO(path.stat().st_mode):
+                raise ValueError(f"{path} exists and is not a FIFO")
+            # Read-write, so there is no end-of-file between writers.
+            self._fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+        else:
+            if path.exists():
+                if not stat.S_ISSOCK(path.stat().st_mode):
+                    raise ValueError(f"{path} exists and is not a socket")
+                path.unlink()
+            self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._server.bind(str(path))
+            os.chmod(path, 0o600)
+            self._server.listen(1)
+
+    def read(self, timeout: Optional[float] = None) -> bytes:
+        """Return the next bytes written, or ``b""`` if ``timeout`` elapsed first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            source = self._fd if self._fd is not None else (self._client or self._server)
+            ready, _, _ = select.select([source], [], [], remaining)
+            if not ready:
+                return b""
+            if self._fd is not None:
+                try:
+                    return os.read(self._fd, LIVE_READ_SIZE)
+                except BlockingIOError:
+                    continue
+            if self._client is None:
+                self._client, _ = self._server.accept()
+                continue
+            data = self._client.recv(LIVE_READ_SIZE)
+            if data:
+                return data
+            self._client.close()
+            self._client = None
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+        for sock in (self._client, self._server):
+            if sock is not None:
+                sock.close()
+        if self._server is not None:
+            self.path.unlink(missing_ok=True)
+
+
+class SpillBuffer:
+    """Batch live bytes in memory before appending them to the on-disk log."""
+
+    def __init__(self, path: Path, capacity: int = LIVE_SPILL_BYTES) -> None:
+        self.handle = path.open("ab+")
+        self.buffer = bytearray(capacity)
+        self.used = 0
+
+    def write(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            take = min(len(view), len(self.buffer) - self.used)
+            self.buffer[self.used:self.used + take] = view[:take]
+            self.used += take
+            view = view[take:]
+            if self.used == len(self.buffer):
+                self.spill()
+
+    def spill(self) -> None:
+        if self.used:
+            self.handle.write(self.buffer[:self.used])
+            self.used = 0
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+
+    def close(self) -> None:
+        self.spill()
+        self.handle.close()
@@ -3,14 +3,38 @@
 from __future__ import annotations
 
 import argparse
+import codecs
+import functools
+import glob
+import gzip
+import hashlib
+import heapq
+import importlib.util
+import itertools
 import json
+import lzma
+import os
 import re
+import signal
+import socket
+import sys
 import textwrap
 import time
-from dataclasses import dataclass
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Generator, Iterable, Iterator, List, Optional, TextIO, Union
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed for .zst archives
+    zstandard = None
+
+from live_capture import LiveStream, SpillBuffer
+from log_watchers import create_watcher, expand_sources
+from output_archive import Archive
 
 BASE_DIR = Path(__file__).resolve().parents[1]
 LOG_PATH = Path("/home/kali/ctf.log")
@@ -22,57 +46,1012 @@ DEFAULT_ENGAGEMENT = {
     "objective": "",
     "last_summary": "",
 }
-IP_RE = re.compile(r"\\b(?:\\d{1,3}\\.){3}\\d{1,3}\\b")
-COMMAND_RE = re.compile(r"^(?P<prompt>[^\n\r]*[$#])\s*(?P<cmd>.+)$")
+READ_CHUNK_SIZE = 1 << 20
+FINGERPRINT_BYTES = 64
+COMPRESSED_SUFFIXES = (".gz", ".xz", ".lzma", ".zst")
+DEFAULT_IDLE_TIMEOUT = 300.0
+DEFAULT_MAX_BLOCK_BYTES = 16 << 20
+PARTIAL_COMPACT_CHARS = 64 * 1024
+TIMING_TOLERANCE = 2.0
+DEFAULT_MAX_CYCLE_BYTES = 64 << 20
+MAX_INGEST_WORKERS = 8
+BACKFILL_MIN_SHARD = 8 << 20
+LIVE_CHECKPOINT = 1.0
+OUTPUT_PREVIEW_CHARS = 512
+NMAP_DETAIL_LINES = 500
+# Per-log keys; kept at the top level of the state before multi-source support.
+SOURCE_KEYS = (
+    "log_offset",
+    "log_device",
+    "log_inode",
+    "log_fingerprint",
+    "log_decoder_pending",
+    "log_carry",
+    "log_timing",
+    "log_bytes_read",
+)
+IP_RE = re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b", re.ASCII)
+# Addresses are collected from at most this much of a block's output.
+HOST_SCAN_CHARS = 1 << 20
+# A prompt is a short run of non-blank text (optionally behind a "(venv) "
+# tag) ending in "$" or "#" and followed by whitespace. Every repetition is
+# bounded, so a match costs the same on a 1 MB hash dump as on a short line.
+PROMPT_RE = re.compile(r"(?P<prompt>(?:\([^()\s]{1,64}\)\s)?[^\s$#]{1,256}[$#])(?=\s)")
+USER_HOST_RE = re.compile(r"[\w.-]+@[\w.-]+:")
+# Prompts recognised even after learning: the second line of Kali's two-line
+# zsh prompt and bash/sh defaults such as "bash-5.2#".
+SHELL_PROMPT_RE = re.compile(r"(?:[└╰]─*|[a-z]+-\d+(?:\.\d+)*)[$#]$")
+# Remote Windows and post-exploitation shells, whose prompts end in ">".
+REMOTE_PROMPT_RE = re.compile(r"(?P<prompt>meterpreter >|(?:\*Evil-WinRM\* )?PS [A-Za-z]:\\[^>]{0,256}>)(?=\s)")
+# Text that every recognised prompt line contains. Multi-character needles
+# cost a full scan each, so the remote ones (whose prompts all end in ">") are
+# only searched for when a single-character ">" check finds one.
+SHELL_PROMPT_MARKS = ("$", "#")
+REMOTE_PROMPT_MARKS = ("PS ", "meterpreter >")
+PROMPT_MARKS = SHELL_PROMPT_MARKS + REMOTE_PROMPT_MARKS
+LOCAL_HOSTNAMES = {"kali", "localhost", socket.gethostname()}
+PROMPT_LEARN_AFTER = 3
+PROMPT_WINDOW = 4096
+MAX_PROMPT_CWD = 256
+# Terminal escape sequences captured by script(1): CSI colours, cursor
+# movement and bracketed-paste markers, OSC window titles, DCS-style strings,
+# charset switches and other two-byte escapes. Anchoring every branch on ESC
+# lets the regex engine skip escape-free text at memchr speed.
+ANSI_RE = re.compile(
+    r"\x1b(?:\[[0-?]*[ -/]*[@-~]"
+    r"|\][^\x07\x1b]*(?:\x07|\x1b\\)?"
+    r"|[P^_X][^\x1b]*(?:\x1b\\)?"
+    r"|[()*+][0-9A-Za-z]"
+    r"|[ -/]*[0-~]?)"
+)
+# Session headers/footers script(1) writes into the typescript, e.g.
+# "Script started on 2023-11-19 23:30:04+00:00 [TERM=...]".
+SCRIPT_MARKER_RE = re.compile(r"^Script (?P<kind>started|done) on (?P<when>.+?)(?: \[.*\])?$")
+SCRIPT_TIME_FORMATS = ("%a %d %b %Y %I:%M:%S %p %Z", "%a %b %d %H:%M:%S %Y", "%a %d %b %Y %H:%M:%S %Z", "%c")
+# Full-screen programs (vim, less, htop, watch, ...) switch to the alternate
+# screen buffer; everything they draw there is gone once they exit.
+ALT_SCREEN_ENTER_RE = re.compile(r"\x1b\[\?(?:1049|1047|47)h")
+ALT_SCREEN_LEAVE_RE = re.compile(r"\x1b\[\?(?:1049|1047|47)l")
+CLEAR_SCREEN_RE = re.compile(r"\x1b\[H\x1b\[2J|\x1b\[2J|\x1bc")
+# Finds either kind of code with one pass, so coloured output (or the
+# bracketed-paste \x1b[?2004h of every prompt) is not scanned for each.
+SCREEN_CODE_RE = re.compile(r"\x1b(?:\[(?:\?(?:1049|1047|47)h|2J)|c)")
+# Tokens that move the cursor or erase within a line while a tool redraws it.
+REDRAW_TOKEN_RE = re.compile(r"(\r|\x08|\x1b\[[012]?K)")
+# Run-specific noise in tool output: timestamps ("at 2024-01-01 10:00 UTC"),
+# clock times, latencies and elapsed times ("scanned in 12.34 seconds").
+# Tools print these in their banners and footers, so only the first and last
+# OUTPUT_NOISE_CHARS of an output are normalized before hashing.
+VOLATILE_RE = re.compile(
+    r"\d{4}-\d\d-\d\d[ T]\d\d:\d\d(?::\d\d(?:\.\d+)?)?(?:Z|[+-]\d\d:?\d\d| [A-Z]{2,5}\b)?"
+    r"|\b\d\d:\d\d:\d\d(?:\.\d+)?"
+    r"|\b\d+(?:\.\d+)?\s?(?:ms|s|seconds?)\b",
+    re.ASCII,
+)
+OUTPUT_NOISE_CHARS = 4096
+# Stray C0 controls (bells from tab completion and the like); \b and \r are
+# kept for line reconstruction.
+CONTROL_RE = re.compile(r"[\x00-\x07\x0b\x0c\x0e-\x1a\x1c-\x1f\x7f]")
 
 
 def utc_now() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
 
+def iso_utc(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).replace(microsecond=0).isoformat()
+
+
+def parse_script_time(text: str) -> Optional[float]:
+    """Parse the date from a ``Script started on`` header into an epoch timestamp."""
+    text = text.strip()
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        parsed = None
+        for fmt in SCRIPT_TIME_FORMATS:
+            try:
+                parsed = datetime.strptime(text, fmt)
+                break
+            except ValueError:
+                continue
+    if parsed is None:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.astimezone()
+    return parsed.timestamp()
+
+
 def load_state() -> Dict:
     if STATE_PATH.exists():
         return json.loads(STATE_PATH.read_text())
     return {
         "engagement": DEFAULT_ENGAGEMENT,
-        "log_offset": 0,
+        "sources": {},
         "timeline": [],
         "hosts": {},
     }
 
 
 def save_state(state: Dict) -> None:
-    STATE_PATH.write_text(json.dumps(state, indent=2, sort_keys=True))
-
-
-def read_new_log_data(offset: int) -> tuple[str, int]:
-    if not LOG_PATH.exists():
-        return "", offset
-    data = LOG_PATH.read_bytes()
-    if offset > len(data):
-        offset = 0
-    return data[offset:].decode(errors="ignore"), len(data)
-
-
-def iter_command_blocks(chunk: str) -> List[Dict[str, str]]:
-    blocks: List[Dict[str, str]] = []
-    current: Optional[Dict[str, List[str]]] = None
-    for raw_line in chunk.splitlines():
-        line = raw_line.rstrip("\r")
-        match = COMMAND_RE.match(line)
-        if match:
-            if current:
-                current["output"] = "\n".join(current["output"]).strip()
-                blocks.append({"command": current["command"], "output": current["output"]})
-            current = {"command": match.group("cmd").strip(), "output": []}
-            continue
+    # Write a sibling file and rename it over the old state, so readers
+    # (notes_to_actions.py, the web UI) never see a half-written file.
+    partial = STATE_PATH.with_name(f".{STATE_PATH.name}.{os.getpid()}.tmp")
+    partial.write_text(json.dumps(state, indent=2, sort_keys=True))
+    os.replace(partial, STATE_PATH)
+
+
+def iter_from(handle, offset: int, end: Optional[int] = None) -> Iterator[bytes]:
+    """Yield the bytes from ``offset`` up to ``end`` (or EOF) of an open binary handle in bounded chunks."""
+    handle.seek(offset)
+    while end is None or offset < end:
+        size = READ_CHUNK_SIZE if end is None else min(READ_CHUNK_SIZE, end - offset)
+        chunk = handle.read(size)
+        if not chunk:
+            return
+        offset += len(chunk)
+        yield chunk
+
+
+def is_compressed(path: Path) -> bool:
+    return path.suffix in COMPRESSED_SUFFIXES
+
+
+def open_log(path: Path):
+    """Open a log for binary reading, decompressing .gz/.xz/.zst archives on the fly."""
+    suffix = path.suffix
+    if suffix == ".gz":
+        return gzip.open(path, "rb")
+    if suffix in (".xz", ".lzma"):
+        return lzma.open(path, "rb")
+    if suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError(f"{path}: install the 'zstandard' package to read .zst logs")
+        return zstandard.ZstdDecompressor().stream_reader(path.open("rb"), read_size=READ_CHUNK_SIZE, read_across_frames=True, closefd=True)
+    return path.open("rb")
+
+
+def file_identity(handle) -> tuple[int, int]:
+    info = os.fstat(handle.fileno())
+    return info.st_dev, info.st_ino
+
+
+def file_fingerprint(handle, offset: int) -> Optional[str]:
+    """Hash the head of the already-consumed region so an in-place replacement can be spotted."""
+    if not offset:
+        return None
+    head = os.pread(handle.fileno(), min(offset, FINGERPRINT_BYTES), 0)
+    return hashlib.blake2b(head, digest_size=8).hexdigest()
+
+
+class LogTail:
+    """Incrementally read the log across truncation, rotation and compressed archives."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.bytes_read = 0
+        # Set when reading starts over at offset 0 of a new or rewritten file;
+        # whoever holds the carried-over block state clears it.
+        self.restarted = False
+        self._handle = None
+        # Uncompressed offset and [size, mtime] of the archive ``_handle`` is positioned in.
+        self._position: Optional[tuple[int, List[int]]] = None
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def _open_previous(self, identity: tuple[int, int]):
+        if self._handle is not None and file_identity(self._handle) == identity:
+            return self._handle
+        for candidate in self.path.parent.glob(self.path.name + "*"):
+            try:
+                info = candidate.stat()
+            except OSError:
+                continue
+            if (info.st_dev, info.st_ino) == identity:
+                return candidate.open("rb")
+        return None
+
+    def iter_chunks(self, state: Dict, limit: Optional[int] = None) -> Iterator[bytes]:
+        """Yield the chunks appended since the saved position, up to ``limit`` bytes."""
+        self.bytes_read = 0
+        if is_compressed(self.path):
+            yield from self._iter_compressed(state, limit)
+            return
+        offset = state.get("log_offset", 0)
+        saved = (state.get("log_device"), state.get("log_inode"))
+        try:
+            current = self.path.open("rb")
+        except FileNotFoundError:
+            current = None
+        if saved[1] is not None and (current is None or file_identity(current) != saved):
+            previous = self._open_previous(saved)
+            if previous is not None:
+                for chunk in iter_from(previous, offset):
+                    offset += len(chunk)
+                    state["log_offset"] = offset
+                    self.bytes_read += len(chunk)
+                    yield chunk
+                    if limit is not None and self.bytes_read >= limit:
+                        # Finish draining the rotated file next cycle.
+                        self._handle = previous
+                        return
+                if previous is not self._handle:
+                    previous.close()
+            if current is None:
+                # The log was moved away and not recreated yet; keep following the old file.
+                return
+            offset = 0
+            self.restarted = True
+            state.pop("log_decoder_pending", None)
+        elif current is not None:
+            if offset > os.fstat(current.fileno()).st_size:
+                offset = 0
+                self.restarted = True
+                state.pop("log_decoder_pending", None)
+            elif state.get("log_fingerprint") not in (None, file_fingerprint(current, offset)):
+                offset = 0
+                self.restarted = True
+                state.pop("log_decoder_pending", None)
         if current is None:
+            return
+        self.close()
+        self._handle = current
+        state["log_offset"] = offset
+        state["log_device"], state["log_inode"] = file_identity(current)
+        state["log_fingerprint"] = file_fingerprint(current, offset)
+        for chunk in iter_from(current, offset):
+            if offset < FINGERPRINT_BYTES:
+                state["log_fingerprint"] = file_fingerprint(current, offset + len(chunk))
+            offset += len(chunk)
+            state["log_offset"] = offset
+            self.bytes_read += len(chunk)
+            yield chunk
+            if limit is not None and self.bytes_read >= limit:
+                return
+
+    def _iter_compressed(self, state: Dict, limit: Optional[int]) -> Iterator[bytes]:
+        try:
+            info = self.path.stat()
+        except FileNotFoundError:
+            return
+        stamp = [info.st_size, info.st_mtime_ns]
+        offset = state.get("log_offset", 0)
+        if (state.get("log_device"), state.get("log_inode")) != (info.st_dev, info.st_ino):
+            self.restarted = state.get("log_inode") is not None
+            offset = 0
+            state.pop("log_decoder_pending", None)
+            state.pop("log_exhausted", None)
+        state["log_offset"] = offset
+        state["log_device"], state["log_inode"] = info.st_dev, info.st_ino
+        if state.get("log_exhausted") == stamp:
+            return
+        # Decompressing streams only seek forward, by reading and discarding,
+        # so the stream a capped cycle stopped in is kept open for the next.
+        if self._handle is None or self._position != (offset, stamp):
+            self.close()
+            self._handle = open_log(self.path)
+            self._handle.seek(offset)
+        handle = self._handle
+        for chunk in iter(lambda: handle.read(READ_CHUNK_SIZE), b""):
+            offset += len(chunk)
+            state["log_offset"] = offset
+            self._position = (offset, stamp)
+            self.bytes_read += len(chunk)
+            yield chunk
+            if limit is not None and self.bytes_read >= limit:
+                return
+        state["log_exhausted"] = stamp
+        self.close()
+
+
+def make_decoder(state: Dict) -> codecs.IncrementalDecoder:
+    """Build a UTF-8 decoder primed with the bytes left pending at ``log_offset``."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    decoder.setstate((bytes.fromhex(state.get("log_decoder_pending", "")), 0))
+    return decoder
+
+
+SHELL_MARK_BYTES = tuple(mark.encode() for mark in SHELL_PROMPT_MARKS) + (b"Script ",)
+REMOTE_MARK_BYTES = tuple(mark.encode() for mark in REMOTE_PROMPT_MARKS)
+
+
+def may_contain_prompt(chunk: bytes) -> bool:
+    # Every prompt PromptDetector accepts contains one of PROMPT_MARKS, and
+    # session markers start with "Script "; bytes.find is far cheaper than
+    # splitting and matching each line of a large output chunk.
+    if any(mark in chunk for mark in SHELL_MARK_BYTES):
+        return True
+    return b">" in chunk and any(mark in chunk for mark in REMOTE_MARK_BYTES)
+
+
+def prompt_needles(text: str) -> tuple[str, ...]:
+    """Return the substrings worth scanning ``text`` for to find prompts and session markers."""
+    needles = SHELL_PROMPT_MARKS + ("Script ",)
+    return needles + REMOTE_PROMPT_MARKS if ">" in text else needles
+
+
+def collapse_line(line: str) -> str:
+    """Replay carriage returns, backspaces and erase-in-line codes; return the visible text."""
+    screen: List[str] = []
+    cursor = 0
+    for token in REDRAW_TOKEN_RE.split(line):
+        if not token:
             continue
-        current["output"].append(line)
-    if current:
-        current["output"] = "\n".join(current["output"]).strip()
-        blocks.append({"command": current["command"], "output": current["output"]})
-    return blocks
+        if token == "\r":
+            cursor = 0
+        elif token == "\x08":
+            cursor = max(0, cursor - 1)
+        elif token == "\x1b[2K":
+            screen = [" "] * len(screen)
+        elif token == "\x1b[1K":
+            screen[:cursor] = " " * min(cursor, len(screen))
+        elif token in ("\x1b[K", "\x1b[0K"):
+            del screen[cursor:]
+        else:
+            if "\x1b" in token:
+                token = ANSI_RE.sub("", token)
+            if cursor > len(screen):
+                screen.extend(" " * (cursor - len(screen)))
+            screen[cursor:cursor + len(token)] = token
+            cursor += len(token)
+    return "".join(screen).rstrip()
+
+
+def sanitize_line(line: str) -> str:
+    """Strip terminal escapes from one log line and resolve in-place redraws."""
+    line = line.rstrip("\r")
+    if "\r" in line or "\x08" in line:
+        line = collapse_line(line)
+    elif "\x1b" in line:
+        line = ANSI_RE.sub("", line)
+    if not line.isprintable():
+        line = CONTROL_RE.sub("", line)
+    return line
+
+
+def sanitize_text(text: str) -> str:
+    """Strip terminal escapes from complete lines and keep only the last redraw of each."""
+    if "\r" in text:
+        text = text.replace("\r\n", "\n")
+    if "\r" in text or "\x08" in text:
+        pieces: List[str] = []
+        done = 0
+        for start, end in iter_lines_containing(text, "\r\x08"):
+            pieces.append(text[done:start])
+            pieces.append(collapse_line(text[start:end]))
+            done = end
+        pieces.append(text[done:])
+        text = "".join(pieces)
+    if "\x1b" in text:
+        text = ANSI_RE.sub("", text)
+    return text
+
+
+def encoded_size(text: str) -> int:
+    return len(text) if text.isascii() else len(text.encode())
+
+
+def iter_lines_containing(text: str, needles: Iterable[str]) -> Iterator[tuple[int, int]]:
+    """Yield (start, end) of each line in ``text`` holding any of ``needles``, once per line."""
+    upcoming = {needle: text.find(needle) for needle in needles}
+    upcoming = {needle: pos for needle, pos in upcoming.items() if pos >= 0}
+    while upcoming:
+        hit = min(upcoming.values())
+        start = text.rfind("\n", 0, hit) + 1
+        end = text.find("\n", hit)
+        if end < 0:
+            end = len(text)
+        yield start, end
+        for needle, pos in list(upcoming.items()):
+            if pos <= end:
+                pos = text.find(needle, end)
+                if pos < 0:
+                    del upcoming[needle]
+                else:
+                    upcoming[needle] = pos
+
+
+class TimingTrack:
+    """Map log byte offsets to wall-clock time using a ``script --log-timing`` file."""
+
+    def __init__(self, path: Path, saved: Optional[Dict] = None) -> None:
+        saved = saved or {}
+        self.path = path
+        self.offset: int = saved.get("offset", 0)
+        self.elapsed: float = saved.get("elapsed", 0.0)
+        self.position: int = saved.get("position", 0)
+        # Log offset of the session's first data byte; None while no usable session is active.
+        self.base: Optional[int] = saved.get("base")
+        self.session_start: Optional[float] = saved.get("session_start")
+        self._handle = None
+        self._buffer = b""
+
+    def to_state(self) -> Dict:
+        return {
+            "offset": self.offset,
+            "elapsed": self.elapsed,
+            "position": self.position,
+            "base": self.base,
+            "session_start": self.session_start,
+        }
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        self._buffer = b""
+
+    def mark(self, kind: str, data_offset: int, started: Optional[float]) -> None:
+        """Handle a ``Script started/done on`` marker whose line ends at ``data_offset``."""
+        self.close()
+        self.offset, self.elapsed, self.position = 0, 0.0, 0
+        self.base, self.session_start = None, started
+        if kind == "started" and self._covers_session(started):
+            self.base = data_offset
+
+    def _covers_session(self, started: Optional[float]) -> bool:
+        try:
+            modified = self.path.stat().st_mtime
+            with self.path.open("rb") as handle:
+                head = handle.read(64)
+                if head.startswith(b"H "):
+                    # The advanced format names its own START_TIME; trust that instead.
+                    return True
+                span = 0.0
+                handle.seek(0)
+                for line in handle:
+                    fields = line.split()
+                    try:
+                        span += float(fields[1] if fields[0] in (b"O", b"I", b"S") else fields[0])
+                    except (IndexError, ValueError):
+                        continue
+        except OSError:
+            return False
+        return started is not None and abs(modified - span - started) <= TIMING_TOLERANCE
+
+    def time_at(self, log_position: int) -> Optional[float]:
+        """Seconds into the session at which the byte at ``log_position`` was written."""
+        if self.base is None or log_position < self.base:
+            return None
+        target = log_position - self.base
+        while self.position <= target:
+            if not self._advance():
+                return None
+        return self.elapsed
+
+    def wall_clock(self, elapsed: float) -> Optional[float]:
+        if self.session_start is None:
+            return None
+        return self.session_start + elapsed
+
+    def annotate(self, block: Dict) -> None:
+        """Attach started/ended/duration to ``block`` when the timing file covers it."""
+        start = self.time_at(block["output_offset"] - 1)
+        if start is None:
+            return
+        started = self.wall_clock(start)
+        if started is not None:
+            block["started"] = iso_utc(started)
+        end = self.time_at(block["end"])
+        if end is None:
+            return
+        block["duration"] = round(end - start, 3)
+        ended = self.wall_clock(end)
+        if ended is not None:
+            block["ended"] = iso_utc(ended)
+
+    def _next_line(self) -> Optional[bytes]:
+        if self._handle is None:
+            try:
+                self._handle = self.path.open("rb")
+            except FileNotFoundError:
+                return None
+            self._handle.seek(self.offset)
+        while b"\n" not in self._buffer:
+            chunk = self._handle.read(64 * 1024)
+            if not chunk:
+                return None
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        self.offset += len(line) + 1
+        return line
+
+    def _advance(self) -> bool:
+        """Consume records up to the next output record; False once the file runs dry."""
+        while True:
+            line = self._next_line()
+            if line is None:
+                return False
+            fields = line.decode(errors="ignore").split()
+            try:
+                if fields[0] in ("O", "I", "S", "H"):
+                    kind, delay = fields[0], float(fields[1])
+                    size = int(fields[2]) if kind == "O" else 0
+                else:
+                    kind, delay, size = "O", float(fields[0]), int(fields[1])
+            except (IndexError, ValueError):
+                continue
+            self.elapsed += delay
+            if kind == "H" and fields[2:3] == ["START_TIME"]:
+                started = parse_script_time(" ".join(fields[3:]))
+                if started is not None:
+                    self.session_start = started - self.elapsed
+            if kind == "O" and size:
+                self.position += size
+                return True
+
+
+@dataclass
+class PromptMatch:
+    command: str
+    prompt: str
+
+
+def prompt_identity(prompt: str) -> str:
+    """Name the shell a prompt belongs to: ``root@target``, ``powershell``, ``meterpreter``, ``└─``..."""
+    if prompt.startswith("meterpreter"):
+        return "meterpreter"
+    if prompt.startswith("*Evil-WinRM*"):
+        return "evil-winrm"
+    if prompt.startswith("PS "):
+        return "powershell"
+    user_host = USER_HOST_RE.search(prompt)
+    if user_host:
+        return user_host.group(0)[:-1]
+    return prompt[:-1]
+
+
+class PromptDetector:
+    """Recognise prompt lines, learning the operator's PS1 shapes as they appear."""
+
+    def __init__(self, saved: Optional[Dict] = None) -> None:
+        saved = saved or {}
+        self.learned: List[tuple[str, str, bool]] = [tuple(shape) for shape in saved.get("learned", [])]
+        self.seen: Dict[str, int] = dict(saved.get("seen", {}))
+        self.local: Optional[str] = saved.get("local")
+
+    def to_state(self) -> Dict:
+        return {"learned": [list(shape) for shape in self.learned], "seen": self.seen, "local": self.local}
+
+    def is_local(self, identity: str) -> bool:
+        if identity == self.local or identity.startswith(("└", "╰")):
+            return True
+        return "@" in identity and identity.split("@", 1)[1] in LOCAL_HOSTNAMES
+
+    def match_raw(self, raw: str, learn: bool = True) -> Optional[PromptMatch]:
+        """Like :meth:`match` for an unsanitized log line; only its head is sanitized unless it matches."""
+        head = sanitize_line(raw[:PROMPT_WINDOW])
+        if not any(mark in head for mark in PROMPT_MARKS):
+            return None
+        found = self.match(head, learn)
+        if found is not None and len(raw) > PROMPT_WINDOW:
+            found = self.match(sanitize_line(raw), learn=False)
+        return found
+
+    def match(self, line: str, learn: bool = True) -> Optional[PromptMatch]:
+        """Return the prompt and the command typed after it on ``line``, or None if it is not a prompt."""
+        for head, term, cwd in self.learned:
+            if not line.startswith(head):
+                continue
+            start = len(head)
+            if cwd:
+                end = line.find(term, start, start + MAX_PROMPT_CWD)
+            else:
+                end = start if line.startswith(term, start) else -1
+            if end >= 0 and line[end + 1:end + 2].isspace():
+                return PromptMatch(line[end + 1:].strip(), line[:end + 1])
+        remote = REMOTE_PROMPT_RE.match(line)
+        if remote:
+            return PromptMatch(line[remote.end():].strip(), remote.group("prompt"))
+        found = PROMPT_RE.match(line)
+        if not found:
+            return None
+        prompt = found.group("prompt")
+        user_host = USER_HOST_RE.search(prompt)
+        if self.learned and not user_host and not SHELL_PROMPT_RE.match(prompt):
+            return None
+        if learn:
+            head = prompt[:user_host.end()] if user_host else prompt[:-1]
+            self._observe((head, prompt[-1], bool(user_host)))
+            if self.local is None:
+                self.local = prompt_identity(prompt)
+        return PromptMatch(line[found.end():].strip(), prompt)
+
+    @staticmethod
+    def header_start(region: str, done: int, start: int) -> int:
+        """Return where the first line of a two-line prompt ending at ``start`` begins (else ``start``)."""
+        if start <= done:
+            return start
+        begin = region.rfind("\n", done, start - 1) + 1 or done
+        if sanitize_line(region[begin:min(start - 1, begin + PROMPT_WINDOW)]).startswith(("┌", "╭")):
+            return begin
+        return start
+
+    def _observe(self, shape: tuple[str, str, bool]) -> None:
+        if shape in self.learned:
+            return
+        key = "\0".join((shape[0], shape[1], "1" if shape[2] else ""))
+        if key not in self.seen and len(self.seen) >= 64:
+            return
+        self.seen[key] = self.seen.get(key, 0) + 1
+        if self.seen[key] >= PROMPT_LEARN_AFTER:
+            self.learned.append(shape)
+            del self.seen[key]
+
+
+def remote_host(identity: str, opener: Optional[Dict], context: List[List]) -> Optional[str]:
+    """Work out which host a newly entered shell runs on."""
+    name = identity.split("@", 1)[1] if "@" in identity else None
+    if name:
+        for known, host in context:
+            if host and known.split("@", 1)[-1] == name:
+                return host
+    if opener is not None:
+        addresses = IP_RE.findall(opener["command"]) or IP_RE.findall(opener["output"])
+        if addresses:
+            return addresses[-1]
+    if name:
+        return name
+    return context[-1][1] if context else None
+
+
+def cap_note(dropped: int, max_output: int) -> str:
+    return f"\n[... {dropped} bytes beyond the {max_output} byte block cap dropped ...]"
+
+
+def screen_note(what: str, start: int, end: int) -> str:
+    return f"[... {what} suppressed (log bytes {start}-{end}) ...]\n"
+
+
+class BlockAssembler:
+    """Split streamed log text into command blocks, holding back the open one."""
+
+    def __init__(
+        self,
+        carry: Optional[Dict] = None,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        max_output: int = DEFAULT_MAX_BLOCK_BYTES,
+        timing: Optional[TimingTrack] = None,
+        detector: Optional[PromptDetector] = None,
+        archive: Optional[Archive] = None,
+    ) -> None:
+        carry = carry or {}
+        self.idle_timeout = idle_timeout
+        self.max_output = max_output
+        self.timing = timing
+        self.archive = archive
+        self.detector = detector or PromptDetector()
+        self.current: Optional[Dict] = carry.get("block")
+        self.partial: str = carry.get("partial", "")
+        # Raw bytes of ``partial`` already collapsed away by redraw compaction.
+        self.partial_extra: int = carry.get("partial_extra", 0)
+        self.position: int = carry.get("position", 0)
+        self.updated: float = carry.get("updated", time.time())
+        # Shells entered from this terminal as [identity, host] pairs, local first.
+        self.context: List[List] = carry.get("context", [])
+        # Log offset where the open alternate-screen session began, if any.
+        self.screen: Optional[int] = carry.get("screen")
+        # Command and output tail of the last finished block, which may have opened a shell.
+        self._opener: Optional[Dict] = None
+
+    def to_state(self) -> Dict:
+        return {
+            "block": self.current,
+            "partial": self.partial,
+            "partial_extra": self.partial_extra,
+            "position": self.position,
+            "updated": self.updated,
+            "context": self.context,
+            "screen": self.screen,
+        }
+
+    @property
+    def host(self) -> Optional[str]:
+        """The remote host the terminal is on, or None when at a local prompt."""
+        return self.context[-1][1] if self.context else None
+
+    def feed(self, text: str, prompts: bool = True) -> Iterator[Dict]:
+        """Consume ``text``; pass ``prompts=False`` when it is known to hold no prompt."""
+        if not text:
+            return
+        self.updated = time.time()
+        if self.partial:
+            # The carried-over line may hold a prompt even if the new text does not.
+            prompts = prompts or any(mark in self.partial for mark in PROMPT_MARKS)
+            text = self.partial + text
+            self.partial = ""
+        screens = self.screen is not None or ("\x1b" in text and SCREEN_CODE_RE.search(text) is not None)
+        if screens:
+            text = yield from self._skip_screens(text, prompts)
+            if self.screen is not None:
+                return
+        cut = text.rfind("\n") + 1
+        region, self.partial = text[:cut], text[cut:]
+        if region:
+            self.position += self.partial_extra
+            self.partial_extra = 0
+            yield from self._consume(region, prompts, screens)
+        if len(self.partial) > PARTIAL_COMPACT_CHARS and "\r" in self.partial:
+            # A progress bar redrawn with \r never ends its line; keep only its
+            # current screen instead of every redraw until the newline arrives.
+            redraw = self.partial.rfind("\r")
+            compacted = collapse_line(self.partial[:redraw]) + self.partial[redraw:]
+            self.partial_extra += encoded_size(self.partial) - encoded_size(compacted)
+            self.partial = compacted
+        if self.current is not None and self.partial and self.detector.match_raw(self.partial, learn=False) is not None:
+            yield self._finish()
+
+    def flush_idle(self, now: Optional[float] = None) -> Iterator[Dict]:
+        """Emit the open block if the log has been quiet for ``idle_timeout`` seconds."""
+        now = time.time() if now is None else now
+        if self.current is None or now - self.updated < self.idle_timeout:
+            return
+        command = self.current["command"]
+        if self.current["output"] or not self.current.get("continued"):
+            yield self._finish()
+        # Output that arrives after an idle flush still belongs to the same command.
+        self.current = {
+            "command": command,
+            "output": [],
+            "size": 0,
+            "offset": self.position,
+            "output_offset": self.position,
+            "continued": True,
+        }
+        if self.host:
+            self.current["host"] = self.host
+
+    def close(self) -> Iterator[Dict]:
+        """Treat the trailing line as complete and emit whatever block is still open."""
+        if self.screen is not None:
+            self.position += self.partial_extra + encoded_size(self.partial)
+            self.partial, self.partial_extra = "", 0
+            self._note("full-screen program output", self.screen, self.position)
+            self.screen = None
+        if self.partial:
+            line, self.partial = self.partial, ""
+            self.position += self.partial_extra
+            self.partial_extra = 0
+            yield from self._consume(line + "\n", True)
+            self.position -= 1
+        if self.current is not None:
+            yield self._finish()
+
+    def restart(self) -> Iterator[Dict]:
+        """Emit the open block and start over at offset 0 of a new or rewritten log."""
+        if self.screen is not None:
+            self._note("full-screen program output", self.screen, self.position)
+            self.screen = None
+        if self.current is not None:
+            yield self._finish()
+        # An unterminated line from the old file can never be completed.
+        self.partial, self.partial_extra, self.position = "", 0, 0
+
+    def _consume(self, region: str, prompts: bool, clears: bool = True) -> Iterator[Dict]:
+        done = 0
+        if prompts:
+            for start, end in iter_lines_containing(region, prompt_needles(region)):
+                raw = region[start:end]
+                marker = None
+                if "Script " in raw[:PROMPT_WINDOW]:
+                    line = sanitize_line(raw[:PROMPT_WINDOW])
+                    marker = SCRIPT_MARKER_RE.match(line) if line.startswith("Script ") else None
+                found = None if marker else self.detector.match_raw(raw)
+                if not marker and found is None:
+                    continue
+                header = self.detector.header_start(region, done, start) if found is not None else start
+                self._append(region[done:header], clears)
+                self.position += encoded_size(region[header:start])
+                if self.current is not None:
+                    yield self._finish()
+                size = encoded_size(region[start:end + 1])
+                if marker and self.timing is not None:
+                    self.timing.mark(marker.group("kind"), self.position + size, parse_script_time(marker.group("when")))
+                elif found is not None:
+                    self._enter(prompt_identity(found.prompt))
+                    self.current = {
+                        "command": found.command,
+                        "output": [],
+                        "size": 0,
+                        "offset": self.position,
+                        "output_offset": self.position + size,
+                    }
+                    if self.host:
+                        self.current["host"] = self.host
+                done = end + 1
+                self.position += size
+        self._append(region[done:], clears)
+
+    def _skip_screens(self, text: str, prompts: bool) -> Generator[Dict, None, str]:
+        """Drop alternate-screen sessions from ``text``, leaving a placeholder."""
+        self.position += self.partial_extra
+        self.partial_extra = 0
+        while True:
+            if self.screen is None:
+                enter = ALT_SCREEN_ENTER_RE.search(text)
+                if enter is None:
+                    return text
+                if enter.start():
+                    yield from self._consume(text[:enter.start()], prompts)
+                self.screen = self.position
+                text = text[enter.start():]
+            leave = ALT_SCREEN_LEAVE_RE.search(text)
+            # A program that never left the screen (a dropped ssh session, a
+            # crashed TUI) is over once the local shell prompts again.
+            resume = self._local_prompt(text, leave.start() if leave else len(text))
+            if resume is not None:
+                self.position += encoded_size(text[:resume])
+                self._note("full-screen program output", self.screen, self.position)
+                self.screen = None
+                text = text[resume:]
+                continue
+            if leave is None:
+                # Carry the last line, from its newline, in case it is a prompt;
+                # the leave sequence may also be split across two chunks.
+                keep = text.rfind("\n")
+                if keep < 0 or len(text) - keep > PROMPT_WINDOW:
+                    keep = text.rfind("\x1b", max(0, len(text) - 8))
+                    keep = len(text) if keep < 0 else keep
+                self.position += encoded_size(text[:keep])
+                self.partial = text[keep:]
+                return ""
+            self.position += encoded_size(text[:leave.end()])
+            self._note("full-screen program output", self.screen, self.position)
+            self.screen = None
+            text = text[leave.end():]
+
+    def _local_prompt(self, text: str, end: int) -> Optional[int]:
+        """Return where the first local prompt line within ``text[:end]`` starts, if any."""
+        region = text[:end]
+        for start, line_end in iter_lines_containing(region, prompt_needles(region)):
+            # Only lines after a newline: the head of ``text`` may be mid-line.
+            if not start:
+                continue
+            found = self.detector.match_raw(region[start:line_end], learn=False)
+            if found is not None and self.detector.is_local(prompt_identity(found.prompt)):
+                return start
+        return None
+
+    def _enter(self, identity: str) -> None:
+        """Track the shell a prompt belongs to: return to one already on the stack or push a new one."""
+        if self.detector.is_local(identity):
+            self.context = [[identity, None]]
+            return
+        for depth, (known, _host) in enumerate(self.context):
+            if known == identity:
+                del self.context[depth + 1:]
+                return
+        self.context.append([identity, remote_host(identity, self._opener, self.context)])
+
+    def _append(self, raw: str, clears: bool = True) -> None:
+        if not raw:
+            return
+        at = self.position
+        self.position += encoded_size(raw)
+        if self.current is None:
+            return
+        if clears and "\x1b" in raw:
+            done = 0
+            for clear in CLEAR_SCREEN_RE.finditer(raw):
+                self._store(raw[done:clear.start()])
+                at += encoded_size(raw[done:clear.start()])
+                self._clear_screen(at)
+                done = clear.start()
+            raw = raw[done:]
+        self._store(raw)
+
+    def _clear_screen(self, at: int) -> None:
+        """Replace what was drawn since the previous clear-screen with a placeholder."""
+        block = self.current
+        if "spill" in block:
+            return
+        frame = block.get("frame")
+        if frame is not None:
+            index, begin = frame
+            block["size"] -= sum(encoded_size(fragment) for fragment in block["output"][index:])
+            del block["output"][index:]
+            self._note("screen redraws", begin, at)
+        block["frame"] = [len(block["output"]), at]
+
+    def _note(self, what: str, start: int, end: int) -> None:
+        """Put a placeholder for log bytes ``start``-``end`` in the open block, extending an adjacent one."""
+        block = self.current
+        if block is None:
+            return
+        if "spill" in block:
+            self._spill(screen_note(what, start, end))
+            return
+        last = block.get("note")
+        if last and last[0] == what and last[2] == start and last[3] == len(block["output"]) - 1:
+            start = last[1]
+            block["size"] -= encoded_size(block["output"].pop())
+        note = screen_note(what, start, end)
+        if block["output"] and not block["output"][-1].endswith("\n"):
+            note = "\n" + note
+        block["output"].append(note)
+        block["size"] = block.get("size", 0) + encoded_size(note)
+        block["note"] = [what, start, end, len(block["output"]) - 1]
+
+    def _store(self, raw: str) -> None:
+        if not raw:
+            return
+        block = self.current
+        text = sanitize_text(raw)
+        if "spill" in block:
+            self._spill(text)
+            return
+        used = block.setdefault("size", 0)
+        size = encoded_size(text)
+        room = self.max_output - used
+        if size > room:
+            keep = text[:max(room, 0)]
+            keep = keep[:keep.rfind("\n") + 1]
+            if self.archive is not None:
+                # What fits stays in memory as the head; the whole output goes to disk.
+                block["spill"] = str(self.archive.spill_path())
+                self._spill("".join(block["output"]) + text)
+            else:
+                block["dropped"] = block.get("dropped", 0) + size - encoded_size(keep)
+            text, size = keep, encoded_size(keep)
+        if text:
+            block["size"] = used + size
+            block["output"].append(text)
+
+    def _spill(self, text: str) -> None:
+        with open(self.current["spill"], "a", encoding="utf-8") as handle:
+            handle.write(text)
+
+    def _finish(self) -> Dict:
+        block, self.current = self.current, None
+        output = "".join(block["output"]).strip()
+        if block.get("dropped"):
+            output += cap_note(block["dropped"], self.max_output)
+        finished = {
+            "command": block["command"],
+            "output": output,
+            "offset": block["offset"],
+            "output_offset": block.get("output_offset", block["offset"]),
+            "end": self.position,
+        }
+        if block.get("host"):
+            finished["host"] = block["host"]
+        if block.get("spill"):
+            finished["output_blob"] = self.archive.store_file(Path(block["spill"]))
+        self._opener = {"command": block["command"], "output": output[-PROMPT_WINDOW:]}
+        if self.timing is not None:
+            self.timing.annotate(finished)
+        return finished
+
+
+def iter_command_blocks(chunk: str) -> Iterator[Dict]:
+    assembler = BlockAssembler()
+    yield from assembler.feed(chunk)
+    yield from assembler.close()
+
+
+def iter_log_blocks(
+    chunks: Iterable[bytes],
+    decoder: codecs.IncrementalDecoder,
+    assembler: BlockAssembler,
+    tail: Optional[LogTail] = None,
+) -> Iterator[Dict]:
+    """Lazily turn raw log chunks into completed command blocks."""
+    for chunk in chunks:
+        if tail is not None and tail.restarted:
+            yield from restart_blocks(decoder, assembler, tail)
+        yield from assembler.feed(decoder.decode(chunk), prompts=may_contain_prompt(chunk))
+    if tail is not None and tail.restarted:
+        yield from restart_blocks(decoder, assembler, tail)
+    yield from assembler.flush_idle()
+
+
+def restart_blocks(decoder: codecs.IncrementalDecoder, assembler: BlockAssembler, tail: LogTail) -> Iterator[Dict]:
+    tail.restarted = False
+    decoder.reset()
+    yield from assembler.restart()
 
 
 @dataclass
@@ -80,56 +1059,187 @@ class CommandSummary:
     summary: str
     details: str
     tags: List[str]
-    hosts: List[str]
+    hosts: List[str] = field(default_factory=list)
 
 
-def summarize_command(cmd: str, output: str, state: Dict) -> CommandSummary:
-    lowered = cmd.lower()
-    tags: List[str] = []
-    hosts = sorted(set(IP_RE.findall(cmd + "\n" + output)))
+@dataclass(frozen=True)
+class Parser:
+    """A summarizer for one family of tools; bump ``version`` when its results change."""
 
-    if lowered.startswith("nmap"):
-        tags.extend(["nmap", "scan"])
-        summary = f"Ran Nmap: {cmd}"
-        details = parse_nmap_output(output, cmd, state)
+    name: str
+    version: int
+    parse: Callable[[str, Union[str, Iterable[str]], Dict, Dict], CommandSummary]
+
+
+# Parsers by the normalized executable name they handle (see command_executable).
+PARSERS: Dict[str, Parser] = {}
+PARSER_PLUGIN_DIR = Path(__file__).resolve().parent / "parsers"
+# Commands that run another command, with the options that take a value and
+# the number of positional arguments (e.g. the duration of `timeout 60`)
+# between them and the wrapped command.
+COMMAND_WRAPPERS = {
+    "sudo": ({"-u", "-g", "-h", "-p", "-C", "-D", "-r", "-t", "-U", "-T"}, 0),
+    "doas": ({"-u", "-C"}, 0),
+    "proxychains": ({"-f"}, 0),
+    "proxychains4": ({"-f"}, 0),
+    "sshpass": ({"-p", "-f", "-d", "-e", "-P"}, 0),
+    "env": ({"-u", "-C", "-S"}, 0),
+    "time": ({"-f", "-o"}, 0),
+    "nice": ({"-n"}, 0),
+    "ionice": ({"-c", "-n", "-p"}, 0),
+    "stdbuf": ({"-i", "-o", "-e"}, 0),
+    "nohup": (set(), 0),
+    "exec": (set(), 0),
+    "command": (set(), 0),
+    "timeout": ({"-s", "-k", "--signal", "--kill-after"}, 1),
+    "rlwrap": ({"-f", "-H", "-p", "-S"}, 0),
+}
+SCRIPT_SUFFIXES = (".py", ".pl", ".rb", ".sh", ".exe")
+
+
+def register_parser(name: str, version: int, executables: Iterable[str]) -> Callable:
+    """Decorator that registers a parse function for ``executables`` (normalized names)."""
+
+    def decorate(parse: Callable) -> Callable:
+        parser = Parser(name, version, parse)
+        for executable in executables:
+            PARSERS[executable.lower()] = parser
+        return parse
+
+    return decorate
+
+
+def load_parser_plugins(directory: Path = PARSER_PLUGIN_DIR) -> List[str]:
+    """Import every ``*.py`` module in ``directory`` so its parsers register themselves."""
+    # Plugins import log_to_notes; when this file runs as a script, point that
+    # name at the running module so they share its registry.
+    sys.modules.setdefault("log_to_notes", sys.modules[__name__])
+    loaded = []
+    for path in sorted(directory.glob("*.py")):
+        if path.name.startswith("_"):
+            continue
+        spec = importlib.util.spec_from_file_location(f"flagcaddy_parsers.{path.stem}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        loaded.append(path.stem)
+    return loaded
+
+
+@functools.lru_cache(maxsize=4096)
+def command_executable(cmd: str) -> str:
+    """Return the lower-cased name of the program ``cmd`` runs, skipping wrappers."""
+    wrapped = False
+    options: set = set()
+    positionals = 0
+    takes_value = False
+    for token in cmd.split():
+        if takes_value:
+            takes_value = False
+            continue
+        if wrapped and token.startswith("-"):
+            takes_value = token in options
+            continue
+        if positionals:
+            positionals -= 1
+            continue
+        name, equals, _ = token.partition("=")
+        if equals and name.isidentifier():
+            continue
+        executable = token.rsplit("/", 1)[-1].lower()
+        if executable in COMMAND_WRAPPERS:
+            wrapped = True
+            options, positionals = COMMAND_WRAPPERS[executable]
+            continue
+        for suffix in SCRIPT_SUFFIXES:
+            if executable.endswith(suffix):
+                return executable[:-len(suffix)]
+        return executable
+    return ""
+
+
+def command_parser(cmd: str) -> Parser:
+    return PARSERS.get(command_executable(cmd), GENERIC_PARSER)
+
+
+def summarize_command(cmd: str, output: Union[str, TextIO], state: Dict, block: Optional[Dict] = None) -> CommandSummary:
+    """Summarize a command from its output, given as text or as a handle on an archived blob."""
+    if isinstance(output, str):
+        head = output
+    else:
+        # Archive streams cannot always seek back, so the head is read once
+        # (to a line boundary) and replayed in front of the rest.
+        head = output.read(HOST_SCAN_CHARS) + output.readline()
+        output = itertools.chain(head.splitlines(keepends=True), output)
+    summary = command_parser(cmd).parse(cmd, output, state, block or {})
+    summary.hosts = sorted(set(summary.hosts + IP_RE.findall(cmd) + IP_RE.findall(head, 0, HOST_SCAN_CHARS)))
+    return summary
+
+
+@register_parser("nmap", 4, ["nmap"])
+def summarize_nmap(cmd: str, output: Union[str, Iterable[str]], state: Dict, block: Dict) -> CommandSummary:
+    # The XML report (-oX/-oA) carries hostnames, OS matches and NSE results
+    # that the console output lacks, and the greppable one (-oG) is far cheaper
+    # to parse for large sweeps; fall back to scraping stdout without either.
+    details = ""
+    for kind, report in nmap_reports(cmd, block):
+        try:
+            if kind == "xml":
+                details = parse_nmap_xml(report, cmd, state)
+            elif report is None:
+                details = parse_nmap_greppable(output, cmd, state)
+            else:
+                with report.open(errors="replace") as handle:
+                    details = parse_nmap_greppable(handle, cmd, state)
+        except OSError:
+            details = ""
         if details:
-            details = "Discovered services:\n" + details
-        else:
-            details = "Nmap executed; waiting on parsed output."
-    elif lowered.startswith("ssh"):
-        tags.extend(["ssh", "access"])
-        summary = f"Attempted SSH: {cmd}"
-        details = "Captured SSH attempt for credential tracking."
-    elif lowered.startswith("feroxbuster") or lowered.startswith("ffuf"):
-        tags.extend(["http", "enum"])
-        summary = f"Enumerated web content: {cmd}"
-        details = "Web enumeration results captured for later review."
-    elif lowered.startswith("gobuster"):
-        tags.extend(["http", "enum"])
-        summary = f"Ran Gobuster: {cmd}"
-        details = "Gobuster output recorded."
-    elif lowered.startswith("enum4linux"):
-        tags.extend(["smb", "enum"])
-        summary = f"Enumerated SMB: {cmd}"
-        details = "Enumerated SMB shares or users."
+            break
+    if not details:
+        details = parse_nmap_output(output, cmd, state)
+    if details:
+        details = "Discovered services:\n" + details
     else:
-        summary = f"Command executed: {cmd}"
-        details = "Log captured for review."
-    if not hosts and tags:
-        hosts = infer_hosts_from_state(state)
-    return CommandSummary(summary=summary, details=details, tags=tags, hosts=hosts)
+        details = "Nmap executed; waiting on parsed output."
+    return CommandSummary(f"Ran Nmap: {cmd}", details, ["nmap", "scan"])
 
 
-def infer_hosts_from_state(state: Dict) -> List[str]:
-    if not state.get("hosts"):
-        return []
-    return sorted(state["hosts"].keys())
+@register_parser("ssh", 1, ["ssh"])
+def summarize_ssh(cmd: str, output: Union[str, Iterable[str]], state: Dict, block: Dict) -> CommandSummary:
+    return CommandSummary(f"Attempted SSH: {cmd}", "Captured SSH attempt for credential tracking.", ["ssh", "access"])
+
+
+@register_parser("web", 1, ["feroxbuster", "ffuf"])
+def summarize_web(cmd: str, output: Union[str, Iterable[str]], state: Dict, block: Dict) -> CommandSummary:
+    return CommandSummary(f"Enumerated web content: {cmd}", "Web enumeration results captured for later review.", ["http", "enum"])
+
 
+@register_parser("gobuster", 1, ["gobuster"])
+def summarize_gobuster(cmd: str, output: Union[str, Iterable[str]], state: Dict, block: Dict) -> CommandSummary:
+    return CommandSummary(f"Ran Gobuster: {cmd}", "Gobuster output recorded.", ["http", "enum"])
 
-def parse_nmap_output(output: str, command: str, state: Dict) -> str:
-    lines = output.splitlines()
+
+@register_parser("enum4linux", 1, ["enum4linux", "enum4linux-ng"])
+def summarize_enum4linux(cmd: str, output: Union[str, Iterable[str]], state: Dict, block: Dict) -> CommandSummary:
+    return CommandSummary(f"Enumerated SMB: {cmd}", "Enumerated SMB shares or users.", ["smb", "enum"])
+
+
+def summarize_generic(cmd: str, output: Union[str, Iterable[str]], state: Dict, block: Dict) -> CommandSummary:
+    return CommandSummary(f"Command executed: {cmd}", "Log captured for review.", [])
+
+
+GENERIC_PARSER = Parser("generic", 1, summarize_generic)
+
+
+def output_lines(output: Union[str, Iterable[str]]) -> Iterable[str]:
+    """Iterate the lines of a block's output, whether held as text or streamed from the archive."""
+    return output.splitlines() if isinstance(output, str) else output
+
+
+def parse_nmap_output(output: Union[str, Iterable[str]], command: str, state: Dict) -> str:
+    lines = output_lines(output)
     collected: List[str] = []
     current_host: Optional[str] = None
+    services: List[tuple[int, str, str, str, str]] = []
     service_section = False
     for line in lines:
         stripped = line.strip()
@@ -138,6 +1248,9 @@ def parse_nmap_output(output: str, command: str, state: Dict) -> str:
             continue
         header = re.match(r"Nmap scan report for (.+)", stripped)
         if header:
+            if current_host:
+                upsert_services(state, current_host, services)
+            services = []
             current_host = header.group(1).strip()
             register_host(state, current_host)
             collected.append(f"- Host {current_host}")
@@ -156,11 +1269,219 @@ def parse_nmap_output(output: str, command: str, state: Dict) -> str:
             service = port_match.group("service")
             info = (port_match.group("info") or "").strip()
             note = info or command
-            upsert_service(state, current_host, port, protocol, service, state_name, note)
+            services.append((port, protocol, service, state_name, note))
             entry = f"    - {protocol}/{port} {service} ({state_name})"
             if info:
                 entry += f" -> {info}"
             collected.append(entry)
+    if current_host:
+        upsert_services(state, current_host, services)
+    return "\n".join(collected)
+
+
+def nmap_reports(cmd: str, block: Dict) -> List[tuple[str, Optional[Path]]]:
+    """Return the ``(kind, path)`` reports an nmap command wrote, XML first."""
+    tokens = cmd.split()
+    wanted = []
+    for flag, value in zip(tokens, tokens[1:]):
+        if flag == "-oX":
+            wanted.append(("xml", value))
+        elif flag == "-oG":
+            wanted.append(("greppable", value))
+        elif flag == "-oA":
+            wanted.extend([("xml", value + ".xml"), ("greppable", value + ".gnmap")])
+    reports: List[tuple[str, Optional[Path]]] = []
+    for kind, name in wanted:
+        if name == "-":
+            if kind == "greppable":
+                reports.append((kind, None))
+            continue
+        path = nmap_report_path(name, block)
+        if path and nmap_report_fits(kind, path, cmd, block.get("started")):
+            reports.append((kind, path))
+    return sorted(reports, key=lambda report: report[0] != "xml")
+
+
+def nmap_report_fits(kind: str, path: Path, cmd: str, started: Optional[str]) -> bool:
+    """Tell whether the scan recorded in a report's header is the one ``cmd`` ran."""
+    args, start = nmap_report_header(kind, path)
+    if args is None or not nmap_args_match(args, cmd):
+        return False
+    # nmap records whole seconds.
+    return start is None or not started or start >= datetime.fromisoformat(started).timestamp() - 1
+
+
+def nmap_report_header(kind: str, path: Path) -> tuple[Optional[str], Optional[float]]:
+    """Return the nmap arguments and start time a report was written with."""
+    try:
+        if kind == "xml":
+            for _event, element in ElementTree.iterparse(path, events=("start",)):
+                start = element.get("start")
+                return element.get("args"), float(start) if start and start.isdigit() else None
+            return None, None
+        with path.open(errors="replace") as handle:
+            header = handle.readline()
+    except (ElementTree.ParseError, OSError):
+        return None, None
+    # "# Nmap 7.94 scan initiated Sat Nov 16 12:00:00 2024 as: nmap -oG ..."
+    when, found, args = header.partition(" as: ")
+    if not header.startswith("# Nmap ") or not found:
+        return None, None
+    try:
+        start = time.mktime(time.strptime(when.partition(" initiated ")[2], "%a %b %d %H:%M:%S %Y"))
+    except ValueError:
+        start = None
+    return args.strip(), start
+
+
+def nmap_args_match(args: str, cmd: str) -> bool:
+    """Compare nmap's recorded argv with the arguments on the command line."""
+    recorded = args.split()[1:]
+    typed = cmd.replace('"', "").replace("'", "").split()
+    for index, word in enumerate(typed):
+        if word.rsplit("/", 1)[-1] != "nmap":
+            continue
+        candidate = typed[index + 1:index + 1 + len(recorded)]
+        # Words the shell expanded ($VAR, ~) can stand for anything.
+        if len(candidate) == len(recorded) and all(
+            word == value or "$" in word or word.startswith("~") for word, value in zip(candidate, recorded)
+        ):
+            return True
+    return False
+
+
+def nmap_report_path(name: str, block: Dict) -> Optional[Path]:
+    """Resolve a report file named on an nmap command line, if it exists here."""
+    if block.get("host") or not name or name.startswith("-"):
+        return None
+    path = Path(name).expanduser()
+    if path.is_absolute():
+        return path if path.is_file() else None
+    bases = [Path(block["cwd"])] if block.get("cwd") else [Path.home(), LOG_PATH.parent, Path.cwd()]
+    for base in bases:
+        if (base / path).is_file():
+            return base / path
+    return None
+
+
+def parse_nmap_xml(path: Path, command: str, state: Dict) -> str:
+    """Stream an nmap XML report into the host inventory; return the detail lines."""
+    collected: List[str] = []
+    omitted = 0
+    root = None
+    try:
+        for event, element in ElementTree.iterparse(path, events=("start", "end")):
+            if root is None:
+                root = element
+            elif event == "end" and element.tag == "host":
+                found = nmap_xml_host(element, command, state)
+                root.clear()
+                # A /16 sweep would bloat the timeline; the inventory has it all.
+                if len(collected) + len(found) <= NMAP_DETAIL_LINES:
+                    collected.extend(found)
+                elif found:
+                    omitted += 1
+    except (ElementTree.ParseError, OSError):
+        pass
+    if omitted:
+        collected.append(f"- ... {omitted} more hosts recorded in the host inventory")
+    return "\n".join(collected)
+
+
+def first_line(text: str) -> str:
+    return text.strip().split("\n", 1)[0].strip()
+
+
+def nmap_xml_host(element: ElementTree.Element, command: str, state: Dict) -> List[str]:
+    status = element.find("status")
+    if status is not None and status.get("state") != "up":
+        return []
+    addresses = element.findall("address")
+    address = next((item.get("addr") for item in addresses if item.get("addrtype") in ("ipv4", "ipv6")), None)
+    if address is None and addresses:
+        address = addresses[0].get("addr")
+    if not address:
+        return []
+    hostnames = [item.get("name") for item in element.findall("hostnames/hostname") if item.get("name")]
+    match = element.find("os/osmatch")
+    os_name = f"{match.get('name')} ({match.get('accuracy')}%)" if match is not None else None
+    register_host(state, address)
+    update_host_info(state, address, hostnames, os_name)
+    collected = [f"- Host {address}" + (f" ({', '.join(hostnames)})" if hostnames else "")]
+    if os_name:
+        collected.append(f"    - OS: {os_name}")
+    services = []
+    for port in element.findall("ports/port"):
+        port_state = port.find("state")
+        state_name = port_state.get("state", "unknown") if port_state is not None else "unknown"
+        service_element = port.find("service")
+        service, info = "unknown", ""
+        if service_element is not None:
+            service = service_element.get("name", "unknown")
+            info = " ".join(filter(None, (service_element.get(key) for key in ("product", "version", "extrainfo"))))
+        protocol, number = port.get("protocol", "tcp"), int(port.get("portid", 0))
+        services.append((number, protocol, service, state_name, info or command))
+        entry = f"    - {protocol}/{number} {service} ({state_name})"
+        if info:
+            entry += f" -> {info}"
+        collected.append(entry)
+        collected.extend(f"        - {script.get('id')}: {first_line(script.get('output', ''))}" for script in port.findall("script"))
+    collected.extend(f"    - {script.get('id')}: {first_line(script.get('output', ''))}" for script in element.findall("hostscript/script"))
+    upsert_services(state, address, services)
+    return collected
+
+
+def parse_nmap_greppable(output: Union[str, Iterable[str]], command: str, state: Dict) -> str:
+    """Parse an nmap greppable (``-oG``) report into the host inventory."""
+    collected: List[str] = []
+    omitted = 0
+    previous = None
+    updated = utc_now()
+    for line in output_lines(output):
+        if not line.startswith("Host: "):
+            continue
+        fields = line.rstrip("\r\n").split("\t")
+        address, _, name = fields[0][6:].partition(" ")
+        name = name.strip("()")
+        ports = os_name = None
+        status = "Up"
+        for item in fields[1:]:
+            key, _, value = item.partition(": ")
+            if key == "Ports":
+                ports = value
+            elif key == "Status":
+                status = value
+            elif key == "OS":
+                os_name = value
+        if status != "Up" or not address:
+            continue
+        new_host = address != previous
+        previous = address
+        if new_host or os_name:
+            register_host(state, address)
+            update_host_info(state, address, [name] if name else [], os_name)
+        # A /16 sweep would bloat the timeline; the inventory has it all.
+        listed = len(collected) < NMAP_DETAIL_LINES
+        if new_host:
+            if listed:
+                collected.append(f"- Host {address}" + (f" ({name})" if name else ""))
+            else:
+                omitted += 1
+        if not ports:
+            continue
+        services = []
+        for entry in ports.split(", "):
+            # port/state/protocol/owner/service/rpc info/version/
+            parts = entry.split("/")
+            if len(parts) < 7 or not parts[0].isdigit():
+                continue
+            port, state_name, protocol, service, info = int(parts[0]), parts[1], parts[2], parts[4] or "unknown", parts[6]
+            services.append((port, protocol, service, state_name, info or command))
+            if listed:
+                collected.append(f"    - {protocol}/{port} {service} ({state_name})" + (f" -> {info}" if info else ""))
+        upsert_services(state, address, services, updated)
+    if omitted:
+        collected.append(f"- ... {omitted} more hosts recorded in the host inventory")
     return "\n".join(collected)
 
 
@@ -169,21 +1490,48 @@ def register_host(state: Dict, host: str) -> None:
     hosts.setdefault(host, {"notes": [], "services": [], "credentials": []})
 
 
+def update_host_info(state: Dict, host: str, hostnames: Iterable[str], os_name: Optional[str]) -> None:
+    data = state["hosts"][host]
+    if hostnames:
+        data["hostnames"] = sorted(set(data.get("hostnames", [])).union(hostnames))
+    if os_name:
+        data["os"] = os_name
+
+
 def upsert_service(state: Dict, host: str, port: int, protocol: str, service: str, state_name: str, note: str) -> None:
+    """Compatibility shim for older plugins; use :func:`upsert_services` for more than one port."""
+    # Each call scans the host's services, so calling this once per port is
+    # quadratic in the number of ports.
+    upsert_services(state, host, [(port, protocol, service, state_name, note)])
+
+
+def upsert_services(
+    state: Dict,
+    host: str,
+    services: Iterable[tuple[int, str, str, str, str]],
+    updated: Optional[str] = None,
+) -> None:
+    """Upsert the ``(port, protocol, service, state, note)`` tuples one scan found on ``host``."""
     register_host(state, host)
-    services = state["hosts"][host].setdefault("services", [])
-    for svc in services:
-        if svc["port"] == port and svc["protocol"] == protocol:
-            svc.update({"service": service, "state": state_name, "note": note, "updated": utc_now()})
-            return
-    services.append({
-        "port": port,
-        "protocol": protocol,
-        "service": service,
-        "state": state_name,
-        "note": note,
-        "updated": utc_now(),
-    })
+    known = state["hosts"][host].setdefault("services", [])
+    by_port: Dict[tuple[str, int], Dict] = {}
+    for svc in known:
+        by_port.setdefault((svc["protocol"], svc["port"]), svc)
+    updated = updated or utc_now()
+    for port, protocol, service, state_name, note in services:
+        svc = by_port.get((protocol, port))
+        if svc is None:
+            svc = by_port[(protocol, port)] = {
+                "port": port,
+                "protocol": protocol,
+                "service": service,
+                "state": state_name,
+                "note": note,
+                "updated": updated,
+            }
+            known.append(svc)
+        else:
+            svc.update({"service": service, "state": state_name, "note": note, "updated": updated})
 
 
 def render_notes(state: Dict) -> str:
@@ -208,6 +1556,10 @@ def render_notes(state: Dict) -> str:
     else:
         for host, data in sorted(state["hosts"].items()):
             lines.append(f"### {host}")
+            if data.get("hostnames"):
+                lines.append(f"- Hostnames: {', '.join(data['hostnames'])}")
+            if data.get("os"):
+                lines.append(f"- OS: {data['os']}")
             notes = data.get("notes") or []
             services = data.get("services") or []
             credentials = data.get("credentials") or []
@@ -244,6 +1596,8 @@ def render_notes(state: Dict) -> str:
             command = entry.get("command", "")
             lines.append(f"- [{timestamp}] {summary}")
             lines.append(f"  - Command: `{command}`")
+            if entry.get("runs", 1) > 1:
+                lines.append(f"  - Runs: {entry['runs']} (last {entry.get('last_seen', '?')})")
             details = entry.get("details")
             if details:
                 for detail_line in details.splitlines():
@@ -258,56 +1612,788 @@ def render_notes(state: Dict) -> str:
     return "\n".join(lines)
 
 
-def process_once(state: Dict) -> Dict:
-    chunk, new_offset = read_new_log_data(state.get("log_offset", 0))
-    state["log_offset"] = new_offset
-    if not chunk.strip():
-        return state
-    blocks = iter_command_blocks(chunk)
-    if not blocks:
-        return state
+def timeline_entry(block: Dict, summary: CommandSummary) -> Dict:
+    entry = {
+        "timestamp": block.get("started") or utc_now(),
+        "command": block["command"],
+        "summary": summary.summary,
+        "details": summary.details,
+        "tags": summary.tags,
+        "hosts": summary.hosts,
+    }
+    for key in ("source", "host", "started", "ended", "duration", "exit", "cwd"):
+        if key in block:
+            entry[key] = block[key]
+    return entry
+
+
+def block_digest(block: Dict) -> str:
+    """Hash a block's command, remote host and output with run-specific noise removed."""
+    output = block["output"]
+    if len(output) > 2 * OUTPUT_NOISE_CHARS:
+        head, middle, tail = output[:OUTPUT_NOISE_CHARS], output[OUTPUT_NOISE_CHARS:-OUTPUT_NOISE_CHARS], output[-OUTPUT_NOISE_CHARS:]
+    else:
+        head, middle, tail = output, "", ""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{block.get('host') or ''}\0{block['command'].strip()}\0{block.get('output_blob', '')}\0".encode())
+    for part in (VOLATILE_RE.sub("", head), middle, VOLATILE_RE.sub("", tail)):
+        digest.update(part.encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+def repeat_entry(block: Dict) -> Dict:
+    """The fields a repeated run updates on the timeline entry it is folded into."""
+    entry = {"runs": 1, "last_seen": block.get("started") or utc_now()}
+    for key in ("ended", "duration", "exit"):
+        if key in block:
+            entry[key] = block[key]
+    return entry
+
+
+def fold_entry(entry: Dict, repeat: Dict) -> None:
+    entry["runs"] = entry.get("runs", 1) + repeat.get("runs", 1)
+    entry["last_seen"] = repeat.get("last_seen") or repeat.get("timestamp")
+    for key in ("ended", "duration", "exit"):
+        if key in repeat:
+            entry[key] = repeat[key]
+
+
+def timeline_index(timeline: List[Dict]) -> Dict[str, Dict]:
+    return {entry["digest"]: entry for entry in timeline if "digest" in entry}
+
+
+def summarize_block(block: Dict, state: Dict, archive: Optional[Archive] = None) -> CommandSummary:
+    if block.get("output_blob") and archive is not None:
+        with archive.open(block["output_blob"]) as handle:
+            summary = summarize_command(block["command"], handle, state, block)
+    else:
+        summary = summarize_command(block["command"], block["output"], state, block)
+    if block.get("host") and block["host"] not in summary.hosts:
+        # Commands typed in a remote shell concern the host it runs on.
+        summary.hosts = sorted(summary.hosts + [block["host"]])
+    return summary
+
+
+def record_blocks(
+    state: Dict,
+    blocks: Iterable[Dict],
+    index: Optional[Dict[str, Dict]] = None,
+    archive: Optional[Archive] = None,
+) -> None:
+    """Add a timeline entry per block to ``state``, folding repeated runs."""
+    timeline = state.setdefault("timeline", [])
+    index = timeline_index(timeline) if index is None else index
+    records: List[Dict] = []
     for block in blocks:
-        summary = summarize_command(block["command"], block["output"], state)
-        state.setdefault("timeline", []).append({
-            "timestamp": utc_now(),
-            "command": block["command"],
-            "summary": summary.summary,
-            "details": summary.details,
-            "tags": summary.tags,
-            "hosts": summary.hosts,
-        })
+        digest = block_digest(block)
+        entry = index.get(digest)
+        if entry is None:
+            # Parse into a scratch inventory first, so the archive remembers what
+            # the entry contributed and --reindex can rebuild the hosts from it.
+            found: Dict = {"hosts": {}}
+            entry = timeline_entry(block, summarize_block(block, found, archive))
+            merge_hosts(state, found["hosts"])
+            entry.update({
+                "digest": digest,
+                "runs": 1,
+                "first_seen": entry["timestamp"],
+                "last_seen": entry["timestamp"],
+                "parser": parser_stamp(block["command"]),
+            })
+            if found["hosts"] and archive is not None:
+                archive.store_inventory(digest, inventory(found["hosts"]))
+            index[digest] = entry
+            timeline.append(entry)
+        else:
+            fold_entry(entry, repeat_entry(block))
+        if archive is not None:
+            record = archive_record(archive, digest, block)
+            entry.setdefault("output_blob", record["blob"])
+            entry.setdefault("preview", block["output"][:OUTPUT_PREVIEW_CHARS])
+            records.append(record)
+    if archive is not None:
+        archive.append_index(records)
+
+
+def parser_stamp(cmd: str) -> List:
+    parser = command_parser(cmd)
+    return [parser.name, parser.version]
+
+
+def inventory(hosts: Dict) -> Dict:
+    """Strip per-update timestamps from parsed hosts so they can be replayed later."""
+    found = {}
+    for host, data in hosts.items():
+        found[host] = {"services": [{key: value for key, value in svc.items() if key != "updated"} for svc in data.get("services", [])]}
+        for key in ("hostnames", "os"):
+            if data.get(key):
+                found[host][key] = data[key]
+    return found
+
+
+def merge_hosts(state: Dict, hosts: Dict) -> None:
+    """Register ``hosts``, as parsed into a scratch state, in ``state``."""
+    for host, data in hosts.items():
+        register_host(state, host)
+        update_host_info(state, host, data.get("hostnames", []), data.get("os"))
+        upsert_services(
+            state,
+            host,
+            ((svc["port"], svc["protocol"], svc["service"], svc["state"], svc["note"]) for svc in data.get("services", [])),
+        )
+
+
+def archive_record(archive: Archive, digest: str, block: Dict) -> Dict:
+    """Store ``block``'s output (unless it was already spilled) and describe it for the index."""
+    record = {
+        "entry": digest,
+        "blob": block.get("output_blob") or archive.put(block["output"]),
+        "command": block["command"],
+        "timestamp": block.get("started") or utc_now(),
+    }
+    for key in ("source", "host", "offset", "end", "exit"):
+        if key in block:
+            record[key] = block[key]
+    return record
+
+
+@dataclass
+class IngestOptions:
+    idle_timeout: float = DEFAULT_IDLE_TIMEOUT
+    max_output: int = DEFAULT_MAX_BLOCK_BYTES
+    max_cycle_bytes: int = DEFAULT_MAX_CYCLE_BYTES
+    timing_path: Optional[Path] = None
+    archive: Optional[Archive] = None
+
+
+def source_state(state: Dict, path: Path) -> Dict:
+    """Return the per-log state for ``path``, adopting pre-multi-source top-level keys."""
+    sources = state.setdefault("sources", {})
+    key = str(path)
+    if key not in sources:
+        # The legacy keys belong to the default log; leave them for it.
+        if path == LOG_PATH:
+            sources[key] = {name: state.pop(name) for name in SOURCE_KEYS if name in state}
+        else:
+            sources[key] = {}
+    return sources[key]
+
+
+def timing_path_for(path: Path, options: IngestOptions, single: bool) -> Optional[Path]:
+    if options.timing_path and single:
+        return options.timing_path
+    sidecar = path.with_suffix(".timing")
+    return sidecar if sidecar != path and sidecar.exists() else None
+
+
+def iter_source_blocks(
+    path: Path,
+    source: Dict,
+    tail: LogTail,
+    options: IngestOptions,
+    timing_path: Optional[Path],
+    detector: PromptDetector,
+) -> Iterator[Dict]:
+    """Stream the completed blocks of one log, updating its per-source state at the end."""
+    decoder = make_decoder(source)
+    timing = TimingTrack(timing_path, source.get("log_timing")) if timing_path else None
+    assembler = BlockAssembler(source.get("log_carry"), options.idle_timeout, options.max_output, timing, detector, options.archive)
+    chunks = tail.iter_chunks(source, options.max_cycle_bytes)
+    for block in iter_log_blocks(chunks, decoder, assembler, tail):
+        block["source"] = path.name
+        block.setdefault("observed", utc_now())
+        yield block
+    source["log_bytes_read"] = tail.bytes_read
+    source["log_decoder_pending"] = decoder.getstate()[0].hex()
+    source["log_carry"] = assembler.to_state()
+    if timing is not None:
+        timing.close()
+        source["log_timing"] = timing.to_state()
+
+
+def block_order(block: Dict) -> str:
+    return block.get("started") or block["observed"]
+
+
+def process_once(
+    state: Dict,
+    sources: Optional[List[Path]] = None,
+    options: Optional[IngestOptions] = None,
+    tails: Optional[Dict[Path, LogTail]] = None,
+) -> Dict:
+    """Stream new log data through the reader, splitter and summarizer into ``state``."""
+    sources = sources or [LOG_PATH]
+    options = options or IngestOptions()
+    owned = tails is None
+    tails = {} if tails is None else tails
+    for path in [path for path in tails if path not in sources]:
+        # The log left the --log glob (rotated away, say); forget its reader.
+        tails.pop(path).close()
+    single = len(sources) == 1
+    detector = PromptDetector(state.get("prompt_shapes"))
+    jobs = []
+    for path in sources:
+        tail = tails.setdefault(path, LogTail(path))
+        jobs.append((path, source_state(state, path), tail, options, timing_path_for(path, options, single), detector))
+    if single:
+        blocks: Iterable[Dict] = iter_source_blocks(*jobs[0])
+    else:
+        with ThreadPoolExecutor(max_workers=min(MAX_INGEST_WORKERS, len(jobs))) as pool:
+            per_source = list(pool.map(lambda job: list(iter_source_blocks(*job)), jobs))
+        blocks = heapq.merge(*per_source, key=block_order)
+    record_blocks(state, blocks, archive=options.archive)
+    state["prompt_shapes"] = detector.to_state()
+    state["log_bytes_read"] = sum(tails[path].bytes_read for path in sources)
+    if owned:
+        for tail in tails.values():
+            tail.close()
+    return state
+
+
+def archive_range(handle, start: int, end: int, archive: Archive) -> str:
+    """Sanitize log bytes ``start``-``end`` line by line into an archive blob; return its digest."""
+    spill = archive.spill_path()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    pending = ""
+    with spill.open("w", encoding="utf-8") as target:
+        for chunk in iter_from(handle, start, end):
+            text = pending + decoder.decode(chunk)
+            cut = text.rfind("\n") + 1
+            target.write(sanitize_text(text[:cut]))
+            pending = text[cut:]
+        target.write(sanitize_text(pending + decoder.decode(b"", final=True)))
+    return archive.store_file(spill)
+
+
+def event_block(handle, event: Dict, max_output: int, archive: Optional[Archive] = None) -> Dict:
+    """Build a block from one shell-hook record by reading its output range from the log."""
+    start = event["output_offset"]
+    size = max(0, event["end_offset"] - start)
+    data = os.pread(handle.fileno(), min(size, max_output), start) if handle is not None and size else b""
+    text = sanitize_text(data.decode("utf-8", "ignore"))
+    dropped = 0
+    blob = None
+    if size > max_output:
+        text = text[:text.rfind("\n") + 1]
+        if archive is not None:
+            blob = archive_range(handle, start, start + size, archive)
+        else:
+            dropped = size - encoded_size(text)
+    output = text.strip()
+    if dropped:
+        output += cap_note(dropped, max_output)
+    block = {
+        "command": event["command"].strip(),
+        "output": output,
+        "offset": start,
+        "output_offset": start,
+        "end": start + size,
+    }
+    if blob:
+        block["output_blob"] = blob
+    for key in ("exit", "cwd"):
+        if key in event:
+            block[key] = event[key]
+    if "start" in event:
+        block["started"] = iso_utc(event["start"])
+        if "end" in event:
+            block["ended"] = iso_utc(event["end"])
+            block["duration"] = round(event["end"] - event["start"], 3)
+    return block
+
+
+def iter_event_blocks(events_path: Path, log_path: Path, source: Dict, tail: LogTail, options: IngestOptions) -> Iterator[Dict]:
+    """Stream blocks for the records appended to a shell-hook events file."""
+    try:
+        handle = log_path.open("rb")
+    except FileNotFoundError:
+        handle = None
+    try:
+        pending = bytes.fromhex(source.get("log_decoder_pending", ""))
+        for chunk in tail.iter_chunks(source, options.max_cycle_bytes):
+            *lines, pending = (pending + chunk).split(b"\n")
+            source["log_decoder_pending"] = pending.hex()
+            for line in lines:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(event, dict) and {"command", "output_offset", "end_offset"} <= event.keys():
+                    block = event_block(handle, event, options.max_output, options.archive)
+                    block["source"] = log_path.name
+                    yield block
+    finally:
+        if handle is not None:
+            handle.close()
+
+
+def process_events(state: Dict, events_path: Path, log_path: Path, options: IngestOptions, tails: Optional[Dict[Path, LogTail]] = None) -> Dict:
+    """Record the commands logged by ``flagcaddy_hook.sh`` since the last cycle."""
+    tails = {} if tails is None else tails
+    tail = tails.setdefault(events_path, LogTail(events_path))
+    blocks = iter_event_blocks(events_path, log_path, source_state(state, events_path), tail, options)
+    record_blocks(state, blocks, archive=options.archive)
+    state["log_bytes_read"] = tail.bytes_read
+    return state
+
+
+def next_prompt_offset(handle, offset: int, detector: PromptDetector) -> Optional[int]:
+    """Return the byte offset of the first local prompt line starting at or after ``offset``."""
+    if offset > 0:
+        handle.seek(offset - 1)
+        if handle.read(1) != b"\n":
+            offset += len(handle.readline())
+    handle.seek(offset)
+    for line in iter(handle.readline, b""):
+        if is_local_prompt_line(line, detector):
+            return offset
+        offset += len(line)
+    return None
+
+
+def is_local_prompt_line(line: bytes, detector: PromptDetector) -> bool:
+    if not may_contain_prompt(line):
+        return False
+    found = detector.match_raw(line.decode("utf-8", "ignore").rstrip("\n"), learn=False)
+    return found is not None and detector.is_local(prompt_identity(found.prompt))
+
+
+def shard_boundaries(path: Path, shards: int, detector: PromptDetector) -> List[int]:
+    """Split ``path`` into up to ``shards`` byte ranges that each begin on a prompt line."""
+    size = path.stat().st_size
+    bounds = [0]
+    with path.open("rb") as handle:
+        for index in range(1, shards):
+            target = size * index // shards
+            if target <= bounds[-1]:
+                continue
+            cut = next_prompt_offset(handle, target, detector)
+            if cut is None:
+                break
+            if cut > bounds[-1]:
+                bounds.append(cut)
+    bounds.append(size)
+    return bounds
+
+
+def summarize_shard(
+    chunks: Iterable[bytes],
+    start: int,
+    max_output: int,
+    shapes: Optional[Dict],
+    archive: Optional[Archive] = None,
+) -> Dict:
+    """Parse and summarize one shard of a log in a worker process."""
+    scratch: Dict = {"hosts": {}, "timeline": []}
+    assembler = BlockAssembler(
+        {"position": start},
+        idle_timeout=float("inf"),
+        max_output=max_output,
+        detector=PromptDetector(shapes),
+        archive=archive,
+    )
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    record_blocks(scratch, [*iter_log_blocks(chunks, decoder, assembler), *assembler.close()], archive=archive)
+    return {"hosts": scratch["hosts"], "entries": scratch["timeline"]}
+
+
+def backfill_shard(path: str, start: int, end: int, max_output: int, shapes: Optional[Dict], archive: Optional[Archive]) -> Dict:
+    with open(path, "rb") as handle:
+        shard = summarize_shard(iter_from(handle, start, end), start, max_output, shapes, archive)
+    shard["bytes"] = end - start
+    return shard
+
+
+def backfill_data(data: bytes, start: int, max_output: int, shapes: Optional[Dict], archive: Optional[Archive]) -> Dict:
+    shard = summarize_shard([data], start, max_output, shapes, archive)
+    shard["bytes"] = len(data)
+    return shard
+
+
+def iter_stream_shards(handle, shard_bytes: int, detector: PromptDetector) -> Iterator[tuple[int, bytes]]:
+    """Cut a forward-only stream into ``(offset, data)`` shards that begin on prompt lines."""
+    start = 0
+    buffer = bytearray()
+    # Lines before ``scan`` have been checked already, so a long prompt-free
+    # stretch is scanned once rather than again for every chunk read.
+    scan = shard_bytes
+    aligned = False
+    for chunk in iter(lambda: handle.read(READ_CHUNK_SIZE), b""):
+        buffer += chunk
+        while True:
+            if not aligned:
+                if scan > len(buffer):
+                    break
+                if buffer[scan - 1] != 0x0A:
+                    newline = buffer.find(b"\n", scan)
+                    if newline < 0:
+                        scan = len(buffer)
+                        break
+                    scan = newline + 1
+                aligned = True
+            newline = buffer.find(b"\n", scan)
+            if newline < 0:
+                break
+            if is_local_prompt_line(bytes(buffer[scan:newline + 1]), detector):
+                yield start, bytes(buffer[:scan])
+                start += scan
+                del buffer[:scan]
+                scan, aligned = shard_bytes, False
+            else:
+                scan = newline + 1
+    if buffer:
+        yield start, bytes(buffer)
+
+
+def merge_backfill(state: Dict, shard: Dict, index: Dict[str, Dict]) -> None:
+    timeline = state.setdefault("timeline", [])
+    for entry in shard["entries"]:
+        if entry["digest"] in index:
+            fold_entry(index[entry["digest"]], entry)
+        else:
+            index[entry["digest"]] = entry
+            timeline.append(entry)
+    merge_hosts(state, shard["hosts"])
+
+
+def learn_prompts(path: Path, detector: PromptDetector) -> None:
+    """Prime ``detector`` with the prompt shapes (and local shell) at the head of ``path``."""
+    with open_log(path) as handle:
+        head = handle.read(READ_CHUNK_SIZE)
+    for _ in BlockAssembler(detector=detector).feed(head.decode("utf-8", "ignore")):
+        pass
+
+
+def iter_backfill_shards(
+    pool: ProcessPoolExecutor,
+    path: Path,
+    jobs: int,
+    max_output: int,
+    shapes: Optional[Dict],
+    archive: Optional[Archive],
+) -> Iterator[Dict]:
+    """Yield the parsed shards of ``path`` in log order as the workers finish them."""
+    detector = PromptDetector(shapes)
+    learn_prompts(path, detector)
+    shapes = detector.to_state()
+    if not is_compressed(path):
+        bounds = shard_boundaries(path, max(1, min(jobs * 4, path.stat().st_size // BACKFILL_MIN_SHARD)), detector)
+        ranges = list(zip(bounds, bounds[1:]))
+        yield from pool.map(
+            backfill_shard,
+            [str(path)] * len(ranges),
+            [start for start, _ in ranges],
+            [end for _, end in ranges],
+            [max_output] * len(ranges),
+            [shapes] * len(ranges),
+            [archive] * len(ranges),
+        )
+        return
+    pending: List = []
+    with open_log(path) as handle:
+        for start, data in iter_stream_shards(handle, BACKFILL_MIN_SHARD, detector):
+            pending.append(pool.submit(backfill_data, data, start, max_output, shapes, archive))
+            if len(pending) > 2 * jobs:
+                yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+
+def backfill(state: Dict, path: Path, jobs: int, max_output: int, archive: Optional[Archive] = None) -> Dict:
+    """Import a complete historic log using all cores and report the throughput."""
+    started = time.perf_counter()
+    size = blocks = shards = 0
+    index = timeline_index(state.setdefault("timeline", []))
+    # Workers started by spawn or forkserver do not inherit the plugins main loaded.
+    with ProcessPoolExecutor(max_workers=jobs, initializer=load_parser_plugins) as pool:
+        for shard in iter_backfill_shards(pool, path, jobs, max_output, state.get("prompt_shapes"), archive):
+            merge_backfill(state, shard, index)
+            size += shard["bytes"]
+            blocks += sum(entry["runs"] for entry in shard["entries"])
+            shards += 1
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(
+        f"[{utc_now()}] backfilled {path}: {size / (1 << 20):.1f} MB, {blocks} blocks in {elapsed:.2f}s "
+        f"({size / (1 << 20) / elapsed:.1f} MB/s, {blocks / elapsed:.0f} blocks/s) over {shards} shards, {jobs} workers",
+        flush=True,
+    )
     return state
 
 
+def reparse_entry(archive: Archive, entry: Dict) -> Dict:
+    """Run the current parser over one entry's archived output in a worker process."""
+    found: Dict = {"hosts": {}}
+    block = {"command": entry["command"], "output": "", "output_blob": entry["output_blob"]}
+    for key in ("host", "cwd", "started"):
+        if entry.get(key):
+            block[key] = entry[key]
+    summary = summarize_block(block, found, archive)
+    return {
+        "summary": summary.summary,
+        "details": summary.details,
+        "tags": summary.tags,
+        "hosts": summary.hosts,
+        "parser": parser_stamp(entry["command"]),
+        "inventory": inventory(found["hosts"]),
+    }
+
+
+def service_keys(hosts: Dict) -> set:
+    return {(host, svc.get("protocol"), svc.get("port")) for host, data in hosts.items() for svc in data.get("services", [])}
+
+
+def reindex(state: Dict, archive: Archive, jobs: int) -> Dict:
+    """Re-parse archived outputs whose parser version changed and rebuild the hosts."""
+    started = time.perf_counter()
+    timeline = [dict(entry) for entry in state.get("timeline", [])]
+    # Entries recorded before inventories moved to the archive still carry theirs.
+    inventories = {
+        entry["digest"]: entry.pop("inventory", None) or archive.load_inventory(entry["digest"])
+        for entry in timeline
+        if "digest" in entry
+    }
+    parsed = set()
+    for found in inventories.values():
+        parsed |= service_keys(found)
+    stale = [entry for entry in timeline if entry.get("output_blob") and entry.get("parser") != parser_stamp(entry["command"])]
+    if stale:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=load_parser_plugins) as pool:
+            results = pool.map(
+                reparse_entry,
+                [archive] * len(stale),
+                stale,
+                chunksize=max(1, len(stale) // (jobs * 8)),
+            )
+            for entry, result in zip(stale, results):
+                inventories[entry["digest"]] = result.pop("inventory")
+                entry.update(result)
+    # Entries from before the archive have no output to re-parse and no
+    # record of what they parsed, so their services are carried over as-is.
+    # So are services no entry parsed: the operator added them by hand.
+    legacy = sum(1 for entry in timeline if "parser" not in entry)
+    rebuilt: Dict = {"hosts": {}}
+    for host, data in state.get("hosts", {}).items():
+        services = [dict(svc) for svc in data.get("services", []) if legacy or (host, svc.get("protocol"), svc.get("port")) not in parsed]
+        if services or data.get("notes") or data.get("credentials"):
+            rebuilt["hosts"][host] = {**data, "services": services}
+    for entry in timeline:
+        merge_hosts(rebuilt, inventories.get(entry.get("digest"), {}))
+    for entry in stale:
+        archive.store_inventory(entry["digest"], inventories[entry["digest"]])
+    elapsed = time.perf_counter() - started
+    print(
+        f"[{utc_now()}] reindexed {len(stale)} of {len(timeline)} entries in {elapsed:.2f}s with {jobs} workers"
+        + (f"; {legacy} entries predate the archive and were kept as-is" if legacy else ""),
+        flush=True,
+    )
+    return {**state, "timeline": timeline, "hosts": rebuilt["hosts"]}
+
+
+def run_live(state: Dict, stream: LiveStream, spill_path: Path, options: IngestOptions, verbose: bool) -> None:
+    """Feed bytes from ``stream`` straight into the block splitter as they arrive."""
+    source = source_state(state, spill_path)
+    decoder = make_decoder(source)
+    detector = PromptDetector(state.get("prompt_shapes"))
+    assembler = BlockAssembler(source.get("log_carry"), options.idle_timeout, options.max_output, detector=detector, archive=options.archive)
+    spill = SpillBuffer(spill_path)
+    index = timeline_index(state.setdefault("timeline", []))
+    received = 0
+    last_checkpoint = time.monotonic()
+
+    def checkpoint() -> None:
+        nonlocal received, last_checkpoint
+        # The log is written before the state pointing past its end, so file
+        # mode resumes exactly where live mode stopped.
+        spill.spill()
+        offset = spill.handle.tell()
+        source["log_offset"] = offset
+        source["log_device"], source["log_inode"] = file_identity(spill.handle)
+        source["log_fingerprint"] = file_fingerprint(spill.handle, offset)
+        source["log_decoder_pending"] = decoder.getstate()[0].hex()
+        source["log_carry"] = assembler.to_state()
+        state["prompt_shapes"] = detector.to_state()
+        state["log_bytes_read"] = received
+        save_state(state)
+        NOTES_PATH.write_text(render_notes(state))
+        report_cycle(state, verbose)
+        received = 0
+        last_checkpoint = time.monotonic()
+
+    try:
+        while True:
+            if received:
+                timeout = max(0.0, LIVE_CHECKPOINT - (time.monotonic() - last_checkpoint))
+            else:
+                timeout = options.idle_timeout if assembler.current else None
+            data = stream.read(timeout)
+            blocks: List[Dict] = []
+            if data:
+                spill.write(data)
+                received += len(data)
+                blocks.extend(assembler.feed(decoder.decode(data), prompts=may_contain_prompt(data)))
+            blocks.extend(assembler.flush_idle())
+            for block in blocks:
+                block["source"] = spill_path.name
+            record_blocks(state, blocks, index, options.archive)
+            if blocks or (received and time.monotonic() - last_checkpoint >= LIVE_CHECKPOINT):
+                checkpoint()
+    finally:
+        checkpoint()
+        spill.close()
+
+
+def report_cycle(state: Dict, verbose: bool) -> None:
+    if not verbose:
+        return
+    offsets = ", ".join(f"{Path(name).name}@{source.get('log_offset', 0)}" for name, source in state.get("sources", {}).items())
+    print(f"[{utc_now()}] read {state.get('log_bytes_read', 0)} bytes ({offsets})", flush=True)
+
+
+def has_open_block(state: Dict) -> bool:
+    return any((source.get("log_carry") or {}).get("block") for source in state.get("sources", {}).values())
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--log",
+        action="append",
+        dest="logs",
+        metavar="PATH",
+        help=f"Log file or glob pattern to ingest; repeat for several panes (default: {LOG_PATH})",
+    )
     parser.add_argument("--loop", action="store_true", help="Continuously watch the log for updates")
     parser.add_argument("--interval", type=int, default=30, help="Polling interval in seconds when --loop is used")
     parser.add_argument("--once", action="store_true", help="Process log once even if no new data is present")
+    parser.add_argument("--verbose", action="store_true", help="Print bytes read from the log on every cycle")
+    parser.add_argument("--poll", action="store_true", help="Poll every --interval seconds instead of using inotify")
+    parser.add_argument(
+        "--flush-after",
+        type=float,
+        default=DEFAULT_IDLE_TIMEOUT,
+        help="Record a still-running command after this many seconds without new log output",
+    )
+    parser.add_argument(
+        "--max-block-bytes",
+        type=int,
+        default=DEFAULT_MAX_BLOCK_BYTES,
+        help="Keep at most this many bytes of output per command block in memory; longer output is spilled to data/archive/",
+    )
+    parser.add_argument(
+        "--timing",
+        type=Path,
+        help="Timing file written by `script --log-timing` for a single log (default: a .timing file next to each log)",
+    )
+    parser.add_argument(
+        "--max-cycle-bytes",
+        type=int,
+        default=DEFAULT_MAX_CYCLE_BYTES,
+        help="Read at most this many bytes from each log per cycle (a run without --loop keeps cycling until caught up)",
+    )
+    parser.add_argument(
+        "--events",
+        type=Path,
+        metavar="PATH",
+        help="Slice command output by the offsets recorded by scripts/flagcaddy_hook.sh instead of scanning for prompts",
+    )
+    live = parser.add_mutually_exclusive_group()
+    live.add_argument("--fifo", type=Path, metavar="PATH", help="Read live output from this named pipe (created if missing)")
+    live.add_argument("--socket", type=Path, metavar="PATH", help="Read live output from a Unix domain socket listening at PATH")
+    parser.add_argument("--backfill", type=Path, metavar="PATH", help="Import a complete historic log in parallel and exit")
+    parser.add_argument(
+        "--reindex",
+        action="store_true",
+        help="Re-parse archived outputs whose parser version changed, rebuild the hosts and exit",
+    )
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Worker processes used by --backfill and --reindex")
     args = parser.parse_args()
 
+    load_parser_plugins()
     NOTES_PATH.parent.mkdir(parents=True, exist_ok=True)
     STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
 
+    patterns = args.logs or [str(LOG_PATH)]
+    options = IngestOptions(
+        idle_timeout=args.flush_after,
+        max_output=args.max_block_bytes,
+        max_cycle_bytes=args.max_cycle_bytes,
+        timing_path=args.timing,
+        archive=Archive(),
+    )
+    if args.reindex:
+        state = reindex(load_state(), options.archive, max(1, args.jobs))
+        save_state(state)
+        NOTES_PATH.write_text(render_notes(state))
+        return
+    if args.backfill:
+        state = backfill(load_state(), args.backfill, max(1, args.jobs), args.max_block_bytes, options.archive)
+        save_state(state)
+        NOTES_PATH.write_text(render_notes(state))
+        return
+
+    if args.fifo or args.socket:
+        if len(patterns) != 1 or glob.has_magic(patterns[0]):
+            parser.error("--fifo and --socket append to a single --log file")
+        # Anything already in the log is processed before live bytes are appended.
+        spill_path = Path(patterns[0])
+        state = process_once(load_state(), [spill_path], options)
+        stream = LiveStream(args.fifo or args.socket, "fifo" if args.fifo else "socket")
+        # Exit through the final checkpoint when stopped by manage_workflow.sh.
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        if args.verbose:
+            print(f"[{utc_now()}] reading {stream.path} into {spill_path}", flush=True)
+        try:
+            run_live(state, stream, spill_path, options, args.verbose)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stream.close()
+        return
+
+    tails: Dict[Path, LogTail] = {}
+    if args.events:
+        if len(patterns) != 1 or glob.has_magic(patterns[0]):
+            parser.error("--events slices a single --log file")
+        watched = [args.events]
+
+        def run_cycle(state: Dict) -> Dict:
+            return process_events(state, args.events, Path(patterns[0]), options, tails)
+    else:
+        watched = [Path(pattern) for pattern in patterns]
+
+        def run_cycle(state: Dict) -> Dict:
+            return process_once(state, expand_sources(patterns), options, tails)
+
     state = load_state()
     if args.once:
-        state = process_once(state)
+        state = run_cycle(state)
     else:
-        state = process_once(state)
+        state = run_cycle(state)
+    if not args.loop:
+        # No later cycle will pick up what the per-cycle cap left unread.
+        while state.get("log_bytes_read", 0) >= args.max_cycle_bytes:
+            save_state(state)
+            state = run_cycle(state)
 
     save_state(state)
     NOTES_PATH.write_text(render_notes(state))
+    report_cycle(state, args.verbose)
 
     if not args.loop:
         return
 
-    interval = max(5, args.interval)
+    watcher = create_watcher(watched, max(5, args.interval), use_inotify=not args.poll)
+    if args.verbose:
+        print(f"[{utc_now()}] watching {', '.join(map(str, watched))} with {type(watcher).__name__}", flush=True)
     while True:
-        time.sleep(interval)
+        backlog = state.get("log_bytes_read", 0) >= args.max_cycle_bytes
+        if not backlog:
+            watcher.wait(args.flush_after if has_open_block(state) else None)
         state = load_state()
-        state = process_once(state)
+        state = run_cycle(state)
         save_state(state)
         NOTES_PATH.write_text(render_notes(state))
+        report_cycle(state, args.verbose)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+"""Wake log_to_notes.py --loop when its logs change."""
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import fnmatch
+import glob
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+WATCH_DEBOUNCE = 0.2
+WATCH_MAX_DELAY = 1.0
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def expand_sources(patterns: Iterable[str]) -> List[Path]:
+    """Resolve log paths and glob patterns (e.g. one ``script`` log per tmux pane)."""
+    sources: List[Path] = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            sources.extend(Path(match) for match in sorted(glob.glob(pattern)))
+        else:
+            sources.append(Path(pattern))
+    return list(dict.fromkeys(sources))
+
+
+class PollingWatcher:
+    """Fallback watcher that simply sleeps for the polling interval."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        return True
+
+
+class InotifyWatcher:
+    """Block until a watched log (or a new log matching a pattern) changes, using inotify via ctypes."""
+
+    def __init__(self, patterns: Iterable[Path]) -> None:
+        self.patterns = list(patterns)
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dir_names: Dict[int, List[str]] = {}
+        for pattern in self.patterns:
+            wd = self._add_watch(pattern.parent, IN_CREATE | IN_MOVED_TO)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"cannot watch {pattern.parent}")
+            self._dir_names.setdefault(wd, []).append(pattern.name)
+        self._arm()
+
+    def _add_watch(self, path: Path, mask: int) -> int:
+        return self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+
+    def _arm(self) -> None:
+        # Re-adding a watch for the same inode is a no-op; after a rotation it
+        # attaches to the new file while the old watch keeps reporting drains.
+        for path in expand_sources(str(pattern) for pattern in self.patterns):
+            if path.exists():
+                self._add_watch(path, IN_MODIFY | IN_ATTRIB | IN_MOVE_SELF | IN_DELETE_SELF)
+
+    def _drain(self) -> bool:
+        relevant = False
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(buffer):
+                wd, _mask, _cookie, length = INOTIFY_EVENT.unpack_from(buffer, pos)
+                event_name = buffer[pos + INOTIFY_EVENT.size:pos + INOTIFY_EVENT.size + length].rstrip(b"\0")
+                pos += INOTIFY_EVENT.size + length
+                names = self._dir_names.get(wd)
+                if names is None or any(fnmatch.fnmatch(os.fsdecode(event_name), name) for name in names):
+                    relevant = True
+        return relevant
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a change to a log; return False if ``timeout`` elapsed first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                return False
+            if self._drain():
+                break
+        settle_by = time.monotonic() + WATCH_MAX_DELAY
+        while True:
+            quiet = min(WATCH_DEBOUNCE, settle_by - time.monotonic())
+            if quiet <= 0 or not select.select([self.fd], [], [], quiet)[0]:
+                break
+            self._drain()
+        self._arm()
+        return True
+
+
+def create_watcher(patterns: Iterable[Path], interval: float, use_inotify: bool = True):
+    if use_inotify and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(patterns)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(interval)
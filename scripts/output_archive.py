@@ -0,0 +1,141 @@
+"""Archive of raw command output recorded by log_to_notes.py."""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Set, TextIO
+
+try:
+    import zstandard
+except ImportError:  # optional: blobs fall back to gzip
+    zstandard = None
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+ARCHIVE_DIR = BASE_DIR / "data/archive"
+ARCHIVE_CHUNK_SIZE = 1 << 20
+ARCHIVE_ZSTD_LEVEL = 3
+ARCHIVE_GZIP_LEVEL = 1
+
+
+class Archive:
+    """Content-addressed, compressed blobs of command output, an ``index.jsonl`` of their runs and what each entry parsed."""
+
+    def __init__(self, root: Path = ARCHIVE_DIR) -> None:
+        self.root = root
+        self.index_path = root / "index.jsonl"
+        self.suffix = ".zst" if zstandard is not None else ".gz"
+        self._blobs = os.path.join(root, "blobs")
+        # Digests already known to be stored; blobs are never removed, so
+        # repeats skip the filesystem entirely.
+        self._stored: Set[str] = set()
+
+    def blob_path(self, digest: str, suffix: Optional[str] = None) -> Path:
+        return Path(self._blob_name(digest, suffix or self.suffix))
+
+    def _blob_name(self, digest: str, suffix: str) -> str:
+        # Plain string formatting: this runs for every recorded block.
+        return f"{self._blobs}/{digest[:2]}/{digest[2:4]}/{digest}{suffix}"
+
+    def find(self, digest: str) -> Optional[Path]:
+        """Return the stored blob for ``digest``, whichever compression it was written with."""
+        for suffix in (".zst", ".gz"):
+            name = self._blob_name(digest, suffix)
+            if os.path.exists(name):
+                self._stored.add(digest)
+                return Path(name)
+        return None
+
+    def has(self, digest: str) -> bool:
+        return digest in self._stored or self.find(digest) is not None
+
+    def spill_path(self) -> Path:
+        """Return a fresh file for a block to stream its output into until it is stored."""
+        spill_dir = self.root / "tmp"
+        spill_dir.mkdir(parents=True, exist_ok=True)
+        return spill_dir / f"{os.getpid()}-{os.urandom(6).hex()}.part"
+
+    def put(self, text: str) -> str:
+        """Store ``text`` unless an identical blob exists; return its digest."""
+        data = text.encode()
+        key = hashlib.sha256(data).hexdigest()
+        if not self.has(key):
+            packed = self.spill_path().with_suffix(self.suffix)
+            with self._writer(packed) as target:
+                target.write(data)
+            self._place(packed, key)
+        return key
+
+    def store_file(self, path: Path) -> str:
+        """Compress a spilled output file into the archive, remove it and return its digest."""
+        digest = hashlib.sha256()
+        packed = path.with_suffix(self.suffix)
+        with path.open("rb") as source, self._writer(packed) as target:
+            for chunk in iter(lambda: source.read(ARCHIVE_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                target.write(chunk)
+        key = digest.hexdigest()
+        self._place(packed, key)
+        path.unlink()
+        return key
+
+    def open(self, digest: str) -> TextIO:
+        path = self.find(digest)
+        if path is None:
+            raise FileNotFoundError(f"no archived output {digest} in {self.root}")
+        if path.suffix == ".gz":
+            return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+        if zstandard is None:
+            raise RuntimeError(f"reading {path} requires the zstandard package (pip install zstandard)")
+        reader = zstandard.ZstdDecompressor().stream_reader(path.open("rb"), read_size=ARCHIVE_CHUNK_SIZE, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8", errors="replace")
+
+    def inventory_path(self, digest: str) -> Path:
+        return self.root / "inventory" / digest[:2] / f"{digest}.json"
+
+    def load_inventory(self, digest: str) -> Dict:
+        """Return the hosts and services timeline entry ``digest`` parsed, if any."""
+        try:
+            return json.loads(self.inventory_path(digest).read_text())
+        except FileNotFoundError:
+            return {}
+
+    def store_inventory(self, digest: str, hosts: Dict) -> None:
+        """Remember what timeline entry ``digest`` parsed, replacing any earlier record."""
+        path = self.inventory_path(digest)
+        if not hosts:
+            path.unlink(missing_ok=True)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp = path.with_suffix(f".{os.getpid()}.tmp")
+        temp.write_text(json.dumps(hosts, separators=(",", ":")))
+        os.replace(temp, path)
+
+    def append_index(self, records: List[Dict]) -> None:
+        """Append index lines with a single write, so concurrent backfill workers do not interleave."""
+        if not records:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records).encode()
+        fd = os.open(self.index_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def _writer(self, path: Path):
+        if self.suffix == ".zst":
+            return zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL).stream_writer(path.open("wb"), closefd=True)
+        return gzip.open(path, "wb", compresslevel=ARCHIVE_GZIP_LEVEL)
+
+    def _place(self, packed: Path, key: str) -> None:
+        if self.has(key):
+            packed.unlink()
+            return
+        blob = self.blob_path(key)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(packed, blob)
+        self._stored.add(key)
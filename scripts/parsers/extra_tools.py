@@ -0,0 +1,168 @@
+"""Summaries for common offensive tooling beyond the parsers built into log_to_notes.py.
+
+Every ``*.py`` module in this directory is imported at start-up; parsers
+register themselves for the executables they handle with
+``@register_parser(name, version, executables)``. Executable names are
+normalized first (wrappers such as sudo or proxychains, paths and script
+suffixes stripped), so ``sudo /opt/impacket/examples/secretsdump.py`` is
+handled by the ``impacket`` parser below.
+"""
+from __future__ import annotations
+
+import re
+from typing import Dict, Iterable, List, Union
+
+from log_to_notes import CommandSummary, output_lines, register_parser, upsert_services
+
+Output = Union[str, Iterable[str]]
+
+MASSCAN_RE = re.compile(r"Discovered open port (?P<port>\d+)/(?P<protocol>\w+) on (?P<host>\S+)")
+MAX_FINDINGS = 50
+
+
+def matching_lines(output: Output, *patterns: Iterable[str]) -> List[str]:
+    """Return up to MAX_FINDINGS stripped output lines containing all needles of any of ``patterns``.
+
+    Archived output is streamed, so it is read in a single pass.
+    """
+    found: List[str] = []
+    for line in output_lines(output):
+        if any(all(needle in line for needle in needles) for needles in patterns):
+            found.append(line.strip())
+            if len(found) >= MAX_FINDINGS:
+                break
+    return found
+
+
+@register_parser("masscan", 1, ["masscan", "rustscan"])
+def summarize_masscan(cmd: str, output: Output, state: Dict, block: Dict) -> CommandSummary:
+    collected: List[str] = []
+    found: Dict[str, List] = {}
+    for line in output_lines(output):
+        match = MASSCAN_RE.search(line)
+        if not match:
+            continue
+        host, port, protocol = match.group("host"), int(match.group("port")), match.group("protocol")
+        found.setdefault(host, []).append((port, protocol, "unknown", "open", cmd))
+        collected.append(f"- {host} {protocol}/{port} open")
+    for host, services in found.items():
+        upsert_services(state, host, services)
+    details = "Discovered ports:\n" + "\n".join(collected) if collected else "Port sweep recorded."
+    return CommandSummary(f"Swept ports: {cmd}", details, ["scan"])
+
+
+@register_parser("smb", 1, ["smbclient", "smbmap", "crackmapexec", "cme", "netexec", "nxc", "rpcclient", "smbget"])
+def summarize_smb(cmd: str, output: Output, state: Dict, block: Dict) -> CommandSummary:
+    hits = matching_lines(output, ["[+]"])
+    details = "Successful checks:\n" + "\n".join(f"- {hit}" for hit in hits) if hits else "SMB/RPC interaction recorded."
+    return CommandSummary(f"Queried SMB: {cmd}", details, ["smb", "enum"])
+
+
+@register_parser("web-scan", 1, ["nikto", "whatweb", "wpscan", "dirb", "dirsearch", "wfuzz", "nuclei", "wafw00f"])
+def summarize_web_scan(cmd: str, output: Output, state: Dict, block: Dict) -> CommandSummary:
+    return CommandSummary(f"Scanned web application: {cmd}", "Web scanner output recorded for review.", ["http", "scan"])
+
+
+@register_parser("sqlmap", 1, ["sqlmap"])
+def summarize_sqlmap(cmd: str, output: Output, state: Dict, block: Dict) -> CommandSummary:
+    hits = matching_lines(output, ["Parameter:"])
+    details = "Injectable parameters:\n" + "\n".join(f"- {hit}" for hit in hits) if hits else "sqlmap run recorded."
+    return CommandSummary(f"Tested SQL injection: {cmd}", details, ["http", "sqli"])
+
+
+@register_parser("http", 1, ["curl", "wget", "httpx"])
+def summarize_http(cmd: str, output: Output, state: Dict, block: Dict) -> CommandSummary:
+    return CommandSummary(f"Fetched over HTTP: {cmd}", "HTTP response captured.", ["http"])
+
+
+@register_parser("bruteforce", 1, ["hydra", "medusa", "patator", "kerbrute", "ncrack"])
+def summarize_bruteforce(cmd: str, output: Output, state: Dict, block: Dict) -> CommandSummary:
+    hits = matching_lines(output, ["login:", "password:"], ["VALID"])
+    details = "Valid credentials:\n" + "\n".join(f"- {hit}" for hit in hits) if hits else "No valid credentials reported."
+    return CommandSummary(f"Brute-forced logins: {cmd}", details, ["bruteforce", "credentials"])
+
+
+@register_parser("cracking", 1, ["john", "hashcat"])
+def summarize_cracking(cmd: str, output: Output, state: Dict, block: Dict) -> CommandSummary:
+    return CommandSummary(f"Cracked hashes: {cmd}", "Hash cracking run recorded.", ["credentials", "cracking"])
+
+
+@register_parser(
+    "impacket",
+    1,
+    [
+        "secretsdump",
+        "getuserspns",
+        "getnpusers",
+        "gettgt",
+        "psexec",
+        "wmiexec",
+        "smbexec",
+        "dcomexec",
+        "atexec",
+        "lookupsid",
+        "ntlmrelayx",
+        "mssqlclient",
+        "impacket-secretsdump",
+        "impacket-getuserspns",
+        "impacket-getnpusers",
+        "impacket-psexec",
+        "impacket-wmiexec",
+        "impacket-smbexec",
+        "impacket-lookupsid",
+        "impacket-ntlmrelayx",
+        "impacket-mssqlclient",
+    ],
+)
+def summarize_impacket(cmd: str, output: Output, state: Dict, block: Dict) -> CommandSummary:
+    hashes = matching_lines(output, [":::"])
+    more = "+" if len(hashes) >= MAX_FINDINGS else ""
+    details = f"Dumped {len(hashes)}{more} hash lines." if hashes else "Impacket tool output recorded."
+    return CommandSummary(f"Ran Impacket: {cmd}", details, ["ad", "impacket"])
+
+
+@register_parser("ldap", 1, ["ldapsearch", "ldapdomaindump", "bloodhound-python", "bloodhound", "windapsearch"])
+def summarize_ldap(cmd: str, output: Output, state: Dict, block: Dict) -> CommandSummary:
+    return CommandSummary(f"Enumerated LDAP/AD: {cmd}", "Directory enumeration recorded.", ["ldap", "ad", "enum"])
+
+
+@register_parser("winrm", 1, ["evil-winrm"])
+def summarize_winrm(cmd: str, output: Output, state: Dict, block: Dict) -> CommandSummary:
+    return CommandSummary(f"Opened WinRM session: {cmd}", "Remote PowerShell session started.", ["winrm", "access"])
+
+
+@register_parser("listener", 1, ["nc", "ncat", "netcat", "socat", "pwncat", "pwncat-cs"])
+def summarize_listener(cmd: str, output: Output, state: Dict, block: Dict) -> CommandSummary:
+    return CommandSummary(f"Raw socket session: {cmd}", "Netcat-style connection or listener recorded.", ["shell"])
+
+
+@register_parser("metasploit", 1, ["msfconsole", "msfvenom"])
+def summarize_metasploit(cmd: str, output: Output, state: Dict, block: Dict) -> CommandSummary:
+    return CommandSummary(f"Used Metasploit: {cmd}", "Metasploit activity recorded.", ["metasploit", "exploit"])
+
+
+@register_parser("searchsploit", 1, ["searchsploit"])
+def summarize_searchsploit(cmd: str, output: Output, state: Dict, block: Dict) -> CommandSummary:
+    hits = [line for line in matching_lines(output, [" | "]) if not line.startswith("-")]
+    details = f"{len(hits)} exploit-db matches listed." if hits else "No exploit-db matches."
+    return CommandSummary(f"Searched exploits: {cmd}", details, ["exploit", "research"])
+
+
+@register_parser("dns", 1, ["dig", "nslookup", "host", "dnsrecon", "dnsenum", "fierce"])
+def summarize_dns(cmd: str, output: Output, state: Dict, block: Dict) -> CommandSummary:
+    return CommandSummary(f"Queried DNS: {cmd}", "DNS lookup recorded.", ["dns", "enum"])
+
+
+@register_parser("snmp", 1, ["snmpwalk", "snmpbulkwalk", "onesixtyone", "snmp-check"])
+def summarize_snmp(cmd: str, output: Output, state: Dict, block: Dict) -> CommandSummary:
+    return CommandSummary(f"Enumerated SNMP: {cmd}", "SNMP data recorded.", ["snmp", "enum"])
+
+
+@register_parser("nfs", 1, ["showmount"])
+def summarize_nfs(cmd: str, output: Output, state: Dict, block: Dict) -> CommandSummary:
+    return CommandSummary(f"Listed NFS exports: {cmd}", "NFS exports recorded.", ["nfs", "enum"])
+
+
+@register_parser("privesc", 1, ["linpeas", "winpeas", "winpeasany", "linenum", "pspy", "pspy64", "les"])
+def summarize_privesc(cmd: str, output: Output, state: Dict, block: Dict) -> CommandSummary:
+    return CommandSummary(f"Ran privilege escalation checks: {cmd}", "Enumeration script output archived for review.", ["privesc", "enum"])